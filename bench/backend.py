@@ -0,0 +1,108 @@
+"""压测用的桩后端（纯 ASGI，由 uvicorn 运行）
+
++ GET  /json?size=256&latency=0            返回指定大小的 JSON，latency 为响应前的延迟（秒）
++ GET  /download?size=1048576&chunk=65536  分块返回指定大小的响应体
++ POST /upload                             读完请求体后返回收到的字节数
++ GET  /sse?events=100&interval=0.01       按间隔推送事件的 text/event-stream
+"""
+import json
+import asyncio
+from urllib.parse import parse_qs
+
+from starlette.types import Receive, Scope, Send
+
+
+def query_params(scope: Scope) -> dict:
+    return {key: values[-1] for key, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+
+
+async def send_bytes(send: Send, body: bytes, content_type: bytes = b"application/json", status: int = 200):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode("latin-1"))],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def handle_json(scope: Scope, receive: Receive, send: Send):
+    params = query_params(scope)
+    latency = float(params.get("latency", 0))
+    if latency > 0:
+        await asyncio.sleep(latency)
+    size = int(params.get("size", 256))
+    # 固定开销的 JSON 外壳，用填充字段凑够大小
+    padding = max(size - len('{"ok":true,"data":""}'), 0)
+    await send_bytes(send, b'{"ok":true,"data":"' + b"x" * padding + b'"}')
+
+
+async def handle_download(scope: Scope, receive: Receive, send: Send):
+    params = query_params(scope)
+    size = int(params.get("size", 1024 * 1024))
+    chunk_size = int(params.get("chunk", 64 * 1024))
+    chunk = b"x" * chunk_size
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/octet-stream"), (b"content-length", str(size).encode("latin-1"))],
+    })
+    remaining = size
+    while remaining > chunk_size:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        remaining -= chunk_size
+    await send({"type": "http.response.body", "body": chunk[:remaining]})
+
+
+async def handle_upload(scope: Scope, receive: Receive, send: Send):
+    received = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        received += len(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    await send_bytes(send, json.dumps({"received": received}).encode("utf-8"))
+
+
+async def handle_sse(scope: Scope, receive: Receive, send: Send):
+    params = query_params(scope)
+    events = int(params.get("events", 100))
+    interval = float(params.get("interval", 0.01))
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+    })
+    for idx in range(events):
+        if interval > 0:
+            await asyncio.sleep(interval)
+        await send({"type": "http.response.body", "body": f"id: {idx}\ndata: {idx}\n\n".encode("latin-1"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+ROUTES = {
+    "/json": handle_json,
+    "/download": handle_download,
+    "/upload": handle_upload,
+    "/sse": handle_sse,
+}
+
+
+async def app(scope: Scope, receive: Receive, send: Send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    # 多组场景下路径带有组前缀（/g12/json），按最后一段匹配
+    handler = ROUTES.get("/" + scope["path"].rsplit("/", 1)[-1])
+    if handler is None:
+        return await send_bytes(send, b'{"detail":"Not Found"}', status=404)
+    await handler(scope, receive, send)
@@ -0,0 +1,152 @@
+"""压测用的负载生成器
+
+直接在 asyncio 流上实现最小的 HTTP/1.1 长连接客户端，尽量减少客户端自身的开销，
+避免压测结果受限于客户端而不是转发服务。
+"""
+import time
+import asyncio
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+# 上传请求体每次写入的大小
+WRITE_CHUNK = 64 * 1024
+
+RequestSpec = Tuple[str, str, Optional[bytes]]  # (方法, 路径, 请求体)
+
+
+class LoadResult(NamedTuple):
+    latencies: List[float]  # 每个成功请求的耗时（秒，含完整读取响应体）
+    errors: int
+    bytes_received: int  # 响应体字节数
+    bytes_sent: int  # 请求体字节数
+    elapsed: float  # 计入统计的时长（秒）
+
+
+class Connection:
+    """单个长连接，服务端关闭或出错后由调用方重新建立"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes]) -> Tuple[int, int]:
+        """发送请求并读完响应体，返回 (状态码, 响应体字节数)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        if body is not None:
+            head += f"Content-Length: {len(body)}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n")
+        if body is not None:
+            view = memoryview(body)
+            for offset in range(0, len(body), WRITE_CHUNK):
+                self.writer.write(view[offset:offset + WRITE_CHUNK])
+                await self.writer.drain()
+        else:
+            await self.writer.drain()
+
+        status_line, headers = await self._read_head()
+        status = int(status_line.split(b" ", 2)[1])
+        if method == "HEAD" or status in (204, 304):
+            size = 0
+        elif headers.get(b"transfer-encoding", b"").lower() == b"chunked":
+            size = await self._read_chunked()
+        elif b"content-length" in headers:
+            size = int(headers[b"content-length"])
+            await self._read_exactly(size)
+        else:
+            # 没有长度的响应以关闭连接结束
+            size = len(await self.reader.read())
+            self.close()
+            return status, size
+
+        if headers.get(b"connection", b"").lower() == b"close":
+            self.close()
+        return status, size
+
+    async def _read_head(self) -> Tuple[bytes, dict]:
+        raw = await self.reader.readuntil(b"\r\n\r\n")
+        lines = raw[:-4].split(b"\r\n")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+        return lines[0], headers
+
+    async def _read_exactly(self, size: int):
+        # 大响应体分块读取，不在内存中拼接
+        while size > 0:
+            chunk = await self.reader.read(min(size, 256 * 1024))
+            if not chunk:
+                raise ConnectionError("响应体未读完连接已关闭")
+            size -= len(chunk)
+
+    async def _read_chunked(self) -> int:
+        total = 0
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            size = int(line.split(b";", 1)[0], 16)
+            if size == 0:
+                # 跳过尾部头
+                while await self.reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return total
+            await self._read_exactly(size + 2)
+            total += size
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run_load(
+        host: str,
+        port: int,
+        make_request: Callable[[int], RequestSpec],
+        concurrency: int,
+        duration: float,
+        warmup: float = 1.0
+) -> LoadResult:
+    """concurrency 个长连接各自循环发送请求，预热 warmup 秒后统计 duration 秒
+
+    make_request(序号) 返回要发送的 (方法, 路径, 请求体)。
+    """
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + warmup
+    stop_at = measure_from + duration
+    latencies: List[float] = []
+    counters = {"errors": 0, "received": 0, "sent": 0}
+    sequence = 0
+
+    async def worker():
+        nonlocal sequence
+        connection = Connection(host, port)
+        while True:
+            if loop.time() >= stop_at:
+                break
+            method, path, body = make_request(sequence)
+            sequence += 1
+            start = time.perf_counter()
+            try:
+                status, size = await connection.request(method, path, body)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                connection.close()
+                ok, size = False, 0
+            else:
+                ok = status < 400
+            end = time.perf_counter()
+            if loop.time() < measure_from or loop.time() > stop_at:
+                continue
+            if ok:
+                latencies.append(end - start)
+                counters["received"] += size
+                counters["sent"] += len(body) if body is not None else 0
+            else:
+                counters["errors"] += 1
+        connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return LoadResult(latencies, counters["errors"], counters["received"], counters["sent"], duration)
@@ -0,0 +1,301 @@
+"""转发服务压测：启动桩后端与转发服务，用并发负载生成器压测，以 JSON 输出 RPS、延迟分位数、CPU 与内存
+
+    python -m bench.run [--scenario small_json ...] [--duration 10] [--concurrency N] [--fastapi] [--direct] [--output result.json]
+
+桩后端、转发服务、负载生成器分别运行在独立的进程中，每个场景启动一个新的转发服务进程，
+CPU 与内存只统计转发服务进程（读取 /proc，仅 Linux）。比较不同提交时应在同一台机器上使用相同的参数。
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from bench.client import LoadResult, RequestSpec, run_load
+
+ROOT = Path(__file__).parents[1]
+BACKEND_PORT = 18900
+PROXY_PORT = 18901
+MB = 1024 * 1024
+
+
+class Scenario(NamedTuple):
+    description: str
+    groups: int  # 转发服务端口上的组数
+    concurrency: int  # 默认并发连接数
+    make_request: Callable[[int], RequestSpec]
+
+
+def group_path(groups: int, idx: int) -> str:
+    return "/bench" if groups == 1 else f"/g{idx % groups}"
+
+
+def without_group(make_request: Callable[[int], RequestSpec]) -> Callable[[int], RequestSpec]:
+    """直连后端时去掉路径中的组前缀"""
+    def make(idx: int) -> RequestSpec:
+        method, path, body = make_request(idx)
+        return method, "/" + path.split("/", 2)[2], body
+    return make
+
+
+UPLOAD_BODY = b"x" * (8 * MB)
+MANY_GROUPS = 200
+
+SCENARIOS: Dict[str, Scenario] = {
+    "small_json": Scenario(
+        "GET 256 字节 JSON", 1, 64,
+        lambda idx: ("GET", "/bench/json?size=256", None)
+    ),
+    "slow_json": Scenario(
+        "GET 256 字节 JSON，后端延迟 50ms", 1, 256,
+        lambda idx: ("GET", "/bench/json?size=256&latency=0.05", None)
+    ),
+    "large_download": Scenario(
+        "GET 8MB 响应体", 1, 16,
+        lambda idx: ("GET", f"/bench/download?size={8 * MB}", None)
+    ),
+    "large_upload": Scenario(
+        "POST 8MB 请求体", 1, 16,
+        lambda idx: ("POST", "/bench/upload", UPLOAD_BODY)
+    ),
+    "sse": Scenario(
+        "SSE，每个流 100 个事件、间隔 10ms", 1, 128,
+        lambda idx: ("GET", "/bench/sse?events=100&interval=0.01", None)
+    ),
+    "many_groups": Scenario(
+        f"同一端口 {MANY_GROUPS} 个组，请求轮流分布到各组", MANY_GROUPS, 64,
+        lambda idx: ("GET", f"{group_path(MANY_GROUPS, idx)}/json?size=256", None)
+    ),
+}
+
+
+def wait_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"端口 {port} 在 {timeout:g} 秒内未就绪")
+
+
+def stop_process(process: subprocess.Popen):
+    if process.poll() is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def process_usage(pid: int) -> Optional[dict]:
+    """读取进程累计的 CPU 时间（秒）与内存（MB），非 Linux 返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # 进程名可能带空格，从最后一个右括号之后开始切分
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        "cpu": (int(fields[11]) + int(fields[12])) / ticks,
+        "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+        "peak_rss_mb": int(status["VmHWM"].split()[0]) / 1024,
+    }
+
+
+def percentile(ordered: List[float], value: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * value / 100), len(ordered) - 1)]
+
+
+def summarize(result: LoadResult, client_cpu: float, before: Optional[dict], after: Optional[dict]) -> dict:
+    ordered = sorted(result.latencies)
+    summary = {
+        "requests": len(ordered),
+        "errors": result.errors,
+        "rps": round(len(ordered) / result.elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(ordered, 50) * 1000, 2),
+            "p95": round(percentile(ordered, 95) * 1000, 2),
+            "p99": round(percentile(ordered, 99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        },
+        "download_mb_s": round(result.bytes_received / MB / result.elapsed, 1),
+        "upload_mb_s": round(result.bytes_sent / MB / result.elapsed, 1),
+        # 负载生成器自身的 CPU 占用接近 100% 时，结果受限于客户端
+        "client_cpu_percent": round(client_cpu / result.elapsed * 100, 1),
+    }
+    if before is not None and after is not None:
+        summary["proxy"] = {
+            "cpu_percent": round((after["cpu"] - before["cpu"]) / result.elapsed * 100, 1),
+            "rss_mb": round(after["rss_mb"], 1),
+            "peak_rss_mb": round(after["peak_rss_mb"], 1),
+        }
+    return summary
+
+
+def start_backend(port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.backend:app", "--port", str(port),
+         "--log-level", "error", "--no-access-log"],
+        cwd=ROOT
+    )
+    wait_port(port)
+    return process
+
+
+def start_proxy(args: argparse.Namespace, groups: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "bench.run", "proxy",
+               "--port", str(args.proxy_port), "--backend-port", str(args.backend_port), "--groups", str(groups)]
+    if args.fastapi:
+        command.append("--fastapi")
+    process = subprocess.Popen(command, cwd=ROOT)
+    wait_port(args.proxy_port)
+    return process
+
+
+def run_scenario(args: argparse.Namespace, name: str) -> dict:
+    scenario = SCENARIOS[name]
+    concurrency = args.concurrency or scenario.concurrency
+    proxy = None
+    port = args.backend_port
+    make_request = scenario.make_request
+    if args.direct:
+        make_request = without_group(make_request)
+    else:
+        proxy = start_proxy(args, scenario.groups)
+        port = args.proxy_port
+
+    async def measure():
+        # 在统计区间的起止时刻采样转发服务与负载生成器的 CPU，不计入预热和收尾
+        usage = {}
+
+        async def sample():
+            await asyncio.sleep(args.warmup)
+            usage["before"] = process_usage(proxy.pid) if proxy is not None else None
+            usage["client_before"] = time.process_time()
+            await asyncio.sleep(args.duration)
+            usage["after"] = process_usage(proxy.pid) if proxy is not None else None
+            usage["client_after"] = time.process_time()
+
+        sampler = asyncio.ensure_future(sample())
+        result = await run_load("127.0.0.1", port, make_request, concurrency, args.duration, args.warmup)
+        await sampler
+        return result, usage
+
+    try:
+        result, usage = asyncio.run(measure())
+    finally:
+        if proxy is not None:
+            stop_process(proxy)
+
+    client_cpu = usage["client_after"] - usage["client_before"]
+    summary = summarize(result, client_cpu, usage["before"], usage["after"])
+    summary["description"] = scenario.description
+    summary["concurrency"] = concurrency
+    return summary
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench(args: argparse.Namespace):
+    names = args.scenario or list(SCENARIOS)
+    backend = start_backend(args.backend_port)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mode": "direct" if args.direct else ("fastapi" if args.fastapi else "lean"),
+        "duration": args.duration,
+        "scenarios": {},
+    }
+    try:
+        for name in names:
+            print(f"运行场景 {name}: {SCENARIOS[name].description}", file=sys.stderr)
+            report["scenarios"][name] = run_scenario(args, name)
+    finally:
+        stop_process(backend)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    print(output)
+
+
+def serve_proxy(args: argparse.Namespace):
+    """转发服务进程：按场景生成配置后运行，SIGTERM 退出"""
+    from daemon import add_signal_handler, install_uvloop
+    from models.base import Backend, Group, Proxy
+    from proxy.base import ProxyServer
+
+    install_uvloop()
+    backend_url = f"http://127.0.0.1:{args.backend_port}"
+    groups = [
+        Group(path=group_path(args.groups, idx), current_backend=0, backends=[Backend(url=backend_url)])
+        for idx in range(args.groups)
+    ]
+
+    async def run():
+        proxy_server = ProxyServer([Proxy(port=args.port, groups=groups)], lean=not args.fastapi)
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        add_signal_handler(loop, signal.SIGTERM, stopped.set)
+        add_signal_handler(loop, signal.SIGINT, stopped.set)
+        servers = asyncio.ensure_future(proxy_server.start_servers())
+        await stopped.wait()
+        proxy_server.shutdown()
+        await servers
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RequestForward 压测")
+    parser.add_argument("--backend-port", type=int, default=BACKEND_PORT, help="桩后端端口")
+    parser.add_argument("--proxy-port", type=int, default=PROXY_PORT, help="转发服务端口")
+    parser.add_argument("--fastapi", action="store_true", help="使用 FastAPI 中间件转发")
+    subparsers = parser.add_subparsers(dest="command")
+
+    proxy_parser = subparsers.add_parser("proxy", help="内部使用：运行转发服务进程")
+    proxy_parser.add_argument("--port", type=int, required=True)
+    proxy_parser.add_argument("--backend-port", type=int, required=True)
+    proxy_parser.add_argument("--groups", type=int, default=1)
+    proxy_parser.add_argument("--fastapi", action="store_true")
+
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS), help="要运行的场景，可重复，默认全部")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="每个场景统计的时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每个场景统计前的预热时长（秒）")
+    parser.add_argument("-c", "--concurrency", type=int, help="并发连接数，默认使用各场景的设置")
+    parser.add_argument("--direct", action="store_true", help="直连桩后端，作为没有转发时的基准")
+    parser.add_argument("-o", "--output", help="结果 JSON 的保存路径")
+    args = parser.parse_args()
+
+    if args.command == "proxy":
+        serve_proxy(args)
+    else:
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
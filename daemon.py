@@ -0,0 +1,125 @@
+"""无界面运行转发服务，不依赖 PyQt6，适合在服务器或容器中运行
+
+    python daemon.py [--config config/config.yml] [--fastapi] [--workers N] [--admin-port PORT] [--watch [SECONDS]]
+
+SIGTERM / SIGINT 退出，SIGHUP 重新加载配置文件，--watch 时配置文件变化后自动重新加载。
+"""
+import signal
+import socket
+import asyncio
+import argparse
+from typing import Dict, Optional
+
+from proxy.base import ProxyServer
+from proxy.workers import Supervisor
+from utils.base import LOGGER
+from utils.config import ConfigManager, ConfigWatcher
+
+
+def install_uvloop() -> bool:
+    """安装了 uvloop 时使用 uvloop 事件循环"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def add_signal_handler(loop: asyncio.AbstractEventLoop, sig: int, callback):
+    try:
+        loop.add_signal_handler(sig, callback)
+    except NotImplementedError:
+        # Windows 事件循环不支持 add_signal_handler
+        signal.signal(sig, lambda *_: loop.call_soon_threadsafe(callback))
+
+
+async def watch_config(interval: float, reload):
+    """定期检查配置文件，变化后重新加载"""
+    watcher = ConfigWatcher(ConfigManager.config_file())
+    while True:
+        await asyncio.sleep(interval)
+        if watcher.changed():
+            LOGGER.info("配置文件已变化，重新加载")
+            reload()
+
+
+async def run(
+        lean: bool,
+        sockets: Dict[int, socket.socket] = None,
+        admin_port: Optional[int] = None,
+        watch: Optional[float] = None,
+        drain_timeout: float = 30.0
+):
+    proxy_server = ProxyServer(
+        ConfigManager.get_config(), lean=lean, sockets=sockets, admin_port=admin_port, drain_timeout=drain_timeout
+    )
+    stopped = asyncio.Event()
+
+    def stop():
+        LOGGER.info("收到退出信号，正在停止服务")
+        stopped.set()
+
+    def reload():
+        try:
+            ConfigManager.load_config()
+            proxy_server.reload(ConfigManager.get_config())
+        except Exception as e:
+            LOGGER.error(f"重新加载配置失败: {e}")
+
+    loop = asyncio.get_running_loop()
+    add_signal_handler(loop, signal.SIGTERM, stop)
+    add_signal_handler(loop, signal.SIGINT, stop)
+    if hasattr(signal, "SIGHUP"):
+        add_signal_handler(loop, signal.SIGHUP, reload)
+
+    servers = asyncio.ensure_future(proxy_server.start_servers())
+    waiter = asyncio.ensure_future(stopped.wait())
+    watcher = asyncio.ensure_future(watch_config(watch, reload)) if watch else None
+    if proxy_server.servers:
+        LOGGER.info(f"监听端口: {sorted(proxy_server.servers)}")
+        # 收到退出信号或服务器自行退出（如端口被占用）时结束
+        await asyncio.wait((servers, waiter), return_when=asyncio.FIRST_COMPLETED)
+    else:
+        LOGGER.warning("未配置任何端口，等待 SIGHUP 重新加载配置")
+        await waiter
+
+    proxy_server.shutdown()
+    waiter.cancel()
+    if watcher is not None:
+        watcher.cancel()
+    await servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RequestForward 无界面转发服务")
+    parser.add_argument("-c", "--config", help="配置文件路径，默认为 config/config.yml")
+    parser.add_argument("--fastapi", action="store_true", help="使用 FastAPI 中间件转发（兼容模式）")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="工作进程数，大于 1 时启用多进程模式")
+    parser.add_argument("--admin-port", type=int, help="管理端口（/metrics 指标），多进程模式下第 i 个工作进程使用 端口+i")
+    parser.add_argument("--watch", type=float, nargs="?", const=1.0, metavar="SECONDS",
+                        help="监听配置文件，变化后自动重新加载（检查间隔，默认 1 秒）")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, metavar="SECONDS",
+                        help="退出或停止端口时等待进行中的请求完成的最长时间，默认 30 秒")
+    args = parser.parse_args()
+
+    if args.config:
+        ConfigManager.set_config_file(args.config)
+
+    if install_uvloop():
+        LOGGER.info("使用 uvloop 事件循环")
+
+    if args.workers > 1:
+        # 每个工作进程各自运行事件循环，共享主进程绑定的监听套接字
+        def target(sockets: Dict[int, socket.socket], slot: int):
+            admin_port = args.admin_port + slot if args.admin_port is not None else None
+            asyncio.run(run(not args.fastapi, sockets, admin_port, drain_timeout=args.drain_timeout))
+
+        # 由主进程监听配置文件，与 SIGHUP 的处理相同
+        Supervisor(args.workers, target, watch=args.watch).run()
+    else:
+        asyncio.run(run(lean=not args.fastapi, admin_port=args.admin_port, watch=args.watch, drain_timeout=args.drain_timeout))
+
+
+if __name__ == '__main__':
+    main()
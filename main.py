@@ -7,6 +7,7 @@ from qasync import QEventLoop
 
 from ui.main_window import MainWindow
 from proxy.base import ProxyServer
+from proxy.runner import ProxyThread
 from utils.config import ConfigManager
 from utils.base import ROOT
 
@@ -16,16 +17,21 @@ if __name__ == '__main__':
 
     app.setWindowIcon(QIcon(str(ROOT / "assets/favor.ico")))
 
-    # 将 asyncio 的事件循环集成到 PyQt 中
+    # 将 asyncio 的事件循环集成到 PyQt 中（仅用于界面中的异步操作）
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
-    # 创建 ProxyServer 和 MainWindow 实例
+    # 创建 ProxyServer 和 MainWindow 实例，代理运行在独立线程中，不受界面阻塞影响
     proxy_server = ProxyServer(ConfigManager.get_config())
-    window = MainWindow(proxy_server)
+    proxy_thread = ProxyThread(proxy_server)
+    window = MainWindow(proxy_thread)
     window.show()
 
-    # 在集成的事件循环中启动协程
+    proxy_thread.start()
+
     with loop:  # 确保事件循环正确关闭
-        asyncio.ensure_future(proxy_server.start_servers())  # 非阻塞地启动协程
-        sys.exit(loop.run_forever())
\ No newline at end of file
+        code = loop.run_forever()
+        # 等待进行中的请求完成
+        proxy_thread.stop(proxy_server.drain_timeout + 1)
+        ConfigManager.flush()
+        sys.exit(code)
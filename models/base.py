@@ -1,10 +1,97 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+
+
+class PoolConfig(BaseModel):
+    """上游连接池配置，未配置时使用默认值"""
+    max_connections: int = Field(100, ge=1)
+    max_keepalive_connections: int = Field(20, ge=0)
+    keepalive_expiry: Optional[float] = Field(30.0, ge=0)
+
+
+class BalanceConfig(BaseModel):
+    """负载均衡配置，配置后请求分摊到组内所有后端，不再只转发到当前后端"""
+    strategy: Literal["round_robin", "weighted", "least_requests", "p2c_ewma", "hash"] = "round_robin"
+    hash_header: Optional[str] = None  # 一致性哈希使用的请求头
+    hash_cookie: Optional[str] = None  # 一致性哈希使用的 Cookie
+
+
+class HealthConfig(BaseModel):
+    """主动健康检查配置，配置后后台定时检查组内所有后端，当前后端异常时自动切换"""
+    interval: float = Field(10.0, gt=0)  # 检查间隔（秒），实际间隔带 ±20% 随机抖动
+    path: str = "/"  # 检查路径，拼接在后端地址后
+    expected_status: Optional[int] = None  # 期望的状态码，为空时只要有响应即视为健康
+    timeout: float = Field(2.0, gt=0)  # 单次检查超时（秒）
+    unhealthy_threshold: int = Field(2, ge=1)  # 连续失败多少次判定为异常
+    healthy_threshold: int = Field(1, ge=1)  # 连续成功多少次恢复为正常
+
+
+class OutlierConfig(BaseModel):
+    """被动异常检测（熔断）配置，根据真实请求的结果摘除异常后端，到期后放行一个试探请求"""
+    consecutive_errors: int = Field(5, ge=1)  # 连续失败（连接错误、超时、5xx）多少次摘除
+    error_rate: Optional[float] = Field(0.5, gt=0, le=1)  # 最近 window 个请求中 5xx 的比例达到多少摘除，为空时不检查
+    window: int = Field(20, ge=1)  # 统计错误率的请求数
+    latency_factor: Optional[float] = Field(None, gt=1)  # 延迟 EWMA 超过组内其他后端中位数的多少倍摘除，为空时不检查
+    ejection_time: float = Field(30.0, gt=0)  # 首次摘除时长（秒），连续摘除时翻倍
+    max_ejection_time: float = Field(300.0, gt=0)  # 最长摘除时长（秒）
+
+
+class TimeoutConfig(BaseModel):
+    """上游超时配置（秒），为空表示不限制，未配置时使用默认值"""
+    connect: Optional[float] = Field(5.0, gt=0)  # 建立连接
+    read: Optional[float] = Field(None, gt=0)  # 两次读取之间的间隔（SSE 等长连接需留空或设得足够大）
+    write: Optional[float] = Field(None, gt=0)  # 两次写入之间的间隔
+    pool: Optional[float] = Field(None, gt=0)  # 等待连接池空闲连接
+    deadline: Optional[float] = Field(None, gt=0)  # 从请求到达到收到上游响应头的整体截止时间（含准入排队、等待合并请求、重试和对冲），超过时立即返回 504
+    deadline_header: Optional[str] = "X-Request-Timeout-Ms"  # 向上游传递剩余时间（毫秒）的请求头，下游传入的值是请求剩余的整体预算，与 deadline 取较小值
+
+
+class CacheConfig(BaseModel):
+    """响应缓存配置，只缓存 GET / HEAD 请求，遵循上游的 Cache-Control / Expires，过期后用 ETag / Last-Modified 重新验证"""
+    max_bytes: int = Field(64 * 1024 * 1024, ge=0)  # 缓存总大小（字节），超过后按最近最少使用淘汰
+    max_entry_bytes: int = Field(1024 * 1024, ge=0)  # 单个响应体的最大字节数，超过的响应不缓存
+    key_headers: List[str] = []  # 额外参与缓存键的请求头（如 Accept-Language，Accept-Encoding 已默认包含），上游的 Vary 头会自动参与匹配
+    default_ttl: Optional[float] = Field(None, ge=0)  # 上游没有给出缓存时间时的默认缓存时间（秒），为空时不缓存；带 Authorization / Cookie 的请求不使用
+
+
+class CoalesceConfig(BaseModel):
+    """请求合并配置，同时到达的相同 GET / HEAD 请求（不带请求体）只转发一次，共享同一份响应"""
+    max_waiters: int = Field(100, ge=1)  # 每个请求最多合并的等待者数，超过的请求各自转发
+    max_bytes: int = Field(1024 * 1024, ge=0)  # 可共享的响应体最大字节数，超过时等待者各自转发
+    key_headers: List[str] = []  # 额外参与合并键的请求头（Authorization、Cookie、Accept-Encoding 等已默认包含）
+
+
+class RetryConfig(BaseModel):
+    """重试与对冲请求配置，只对不带请求体的 GET / HEAD / OPTIONS 请求生效"""
+    attempts: int = Field(1, ge=0)  # 连接失败时最多重试的次数，优先换到下一个健康的后端
+    hedge_percentile: Optional[float] = Field(None, gt=0, lt=100)  # 超过该百分位延迟仍未响应时向下一个后端发出对冲请求（仅 GET / HEAD），为空时不对冲
+    hedge_min_delay: float = Field(0.05, ge=0)  # 对冲等待时间的下限（秒）
+    budget_ratio: float = Field(0.1, ge=0, le=1)  # 重试与对冲请求数不超过正常请求数的比例
+    budget_burst: int = Field(10, ge=0)  # 允许突发的重试与对冲请求数
+
+
+class LimitConfig(BaseModel):
+    """准入控制配置，超过容量时快速拒绝（并发满 503、超过速率 429，均带 Retry-After），为空的项不限制"""
+    max_in_flight: Optional[int] = Field(None, ge=1)  # 组内同时转发的最大请求数
+    max_in_flight_per_backend: Optional[int] = Field(None, ge=1)  # 每个后端同时转发的最大请求数
+    queue_size: int = Field(0, ge=0)  # 组内并发已满时最多排队等待的请求数
+    queue_timeout: float = Field(1.0, gt=0)  # 排队的最长等待时间（秒），超时返回 503
+    rate: Optional[float] = Field(None, gt=0)  # 组内每秒允许的请求数（令牌桶）
+    burst: Optional[int] = Field(None, ge=1)  # 令牌桶容量，为空时等于 rate（至少为 1）
+    retry_after: int = Field(1, ge=0)  # 并发已满时 Retry-After 的秒数
+
+
+class TraceConfig(BaseModel):
+    """请求耗时分解配置：按阶段计时，可在响应中返回 Server-Timing 头，并保留最近的慢请求"""
+    server_timing: bool = True  # 在响应中返回 Server-Timing 头（路由匹配、排队、取得连接、上游响应头）
+    slow_threshold: float = Field(1.0, ge=0)  # 总耗时（含响应体转发）达到多少秒时记录为慢请求，为 0 时记录所有请求
+    keep: int = Field(100, ge=1)  # 保留的最近慢请求数
 
 
 class Backend(BaseModel):
     url: str
     alias: Optional[str] = None
+    weight: int = Field(1, ge=0)
 
 
 class Group(BaseModel):
@@ -12,8 +99,18 @@ class Group(BaseModel):
     alias: Optional[str] = None
     current_backend: Optional[int] = None
     backends: List[Backend] = None
+    pool: Optional[PoolConfig] = None
+    balance: Optional[BalanceConfig] = None
+    health: Optional[HealthConfig] = None
+    outlier: Optional[OutlierConfig] = None
+    timeout: Optional[TimeoutConfig] = None
+    cache: Optional[CacheConfig] = None
+    coalesce: Optional[CoalesceConfig] = None
+    retry: Optional[RetryConfig] = None
+    limit: Optional[LimitConfig] = None
+    trace: Optional[TraceConfig] = None
 
 
 class Proxy(BaseModel):
     port: int = Field(..., ge=1, le=65535)
-    groups: List[Group] = None
\ No newline at end of file
+    groups: List[Group] = None
@@ -0,0 +1,63 @@
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs
+
+from starlette.types import Receive, Scope, Send
+
+from proxy.asgi import send_json
+
+if TYPE_CHECKING:
+    from proxy.base import ProxyServer
+
+
+class AdminApp:
+    """管理端口上的 ASGI 应用
+
+    + GET /metrics：Prometheus 文本格式的转发指标
+    + GET /traces：配置了请求计时的组记录的最近慢请求，按时间倒序，
+      可用 port、group 参数筛选，limit 限制条数（默认 50）
+    """
+
+    def __init__(self, proxy_server: "ProxyServer"):
+        self.proxy_server = proxy_server
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        if scope["path"] == "/metrics" and scope["method"] in ("GET", "HEAD"):
+            body = self.proxy_server.metrics.render().encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+            return
+
+        if scope["path"] == "/traces" and scope["method"] == "GET":
+            return await send_json(send, 200, {"traces": self.traces(scope["query_string"])})
+
+        await send_json(send, 404, {"detail": "Not Found"})
+
+    def traces(self, query_string: bytes) -> list:
+        params = {key: values[-1] for key, values in parse_qs(query_string.decode("latin-1")).items()}
+        limit = int(params["limit"]) if params.get("limit", "").isdigit() else 50
+        traces = [
+            trace
+            for (port, path), log in self.proxy_server.traces.items()
+            if params.get("port") in (None, str(port)) and params.get("group") in (None, path)
+            for trace in log.traces
+        ]
+        traces.sort(key=lambda trace: trace["timestamp"], reverse=True)
+        return traces[:limit]
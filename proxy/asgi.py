@@ -0,0 +1,157 @@
+import json
+import time
+import asyncio
+from typing import Any, List, Optional, Tuple, TYPE_CHECKING
+
+import httpx
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+from proxy.cache import CachedResponse
+from proxy.headers import downstream_response_headers
+from proxy.limit import Overloaded
+from proxy.stream import ReceiveStream, has_request_body
+
+if TYPE_CHECKING:
+    from proxy.base import ProxyServer
+
+
+async def send_json(send: Send, status_code: int, content: Any, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    """发送 JSON 响应，格式与 FastAPI 的 JSONResponse 一致"""
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *(headers or ()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_disconnect(receive: Receive):
+    """请求体读完后，receive 只会在下游断开或响应结束时返回 http.disconnect"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_body(response: httpx.Response, send: Send):
+    async for chunk in response.aiter_raw():
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class ForwardApp:
+    """纯 ASGI 转发应用
+
+    直接在 scope/receive/send 上完成路由匹配与转发，
+    不经过 FastAPI 的 BaseHTTPMiddleware、Request 对象和路由匹配。
+    所有端口共用一个实例，按连接实际监听的端口（而不是 Host 头中的端口）分发。
+    """
+
+    def __init__(self, proxy_server: "ProxyServer"):
+        self.proxy_server = proxy_server
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            await self.forward(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "websocket":
+            # 暂不支持 WebSocket 转发
+            await send({"type": "websocket.close", "code": 1000})
+
+    async def lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def forward(self, scope: Scope, receive: Receive, send: Send):
+        start = time.perf_counter()
+        port = scope["server"][1]
+        headers = [(key.decode("latin-1"), value.decode("latin-1")) for key, value in scope["headers"]]
+        route, row, target_url = self.proxy_server.match_target(port, scope["path"], headers)
+
+        if route is None:
+            if self.proxy_server.metrics is not None:
+                self.proxy_server.metrics.unmatched(port)
+            return await send_json(send, 503, {"error": '无可用或未启用后端服务'})
+
+        if not target_url:
+            return await send_json(send, 404, {"detail": "Not Found"})
+
+        body = ReceiveStream(receive) if has_request_body(headers) else None
+        trace = self.proxy_server.start_trace(route, scope["method"], scope["path"], start)
+
+        # 转发请求
+        try:
+            response = await self.proxy_server.fetch(
+                route,
+                row,
+                scope["method"],
+                scope["path"],
+                target_url,
+                scope["query_string"],
+                headers,
+                body,
+                trace
+            )
+        except ClientDisconnect:
+            return
+        except Overloaded as e:
+            return await send_json(send, e.status_code, {"error": str(e)}, [(b"retry-after", str(e.retry_after).encode("latin-1"))])
+        except httpx.TimeoutException:
+            return await send_json(send, 504, {"error": '目标服务器响应超时'})
+        except (ConnectionError, httpx.ConnectError):
+            return await send_json(send, 503, {"error": '目标服务器未运行或不可用'})
+        except Exception as e:
+            return await send_json(send, 500, {"error": str(e)})
+
+        timing = trace.server_timing() if trace is not None and trace.log.config.server_timing else None
+
+        if isinstance(response, CachedResponse):
+            # 缓存命中，直接返回
+            response_headers = response.headers if timing is None else [*response.headers, (b"server-timing", timing)]
+            await send({"type": "http.response.start", "status": response.status, "headers": response_headers})
+            return await send({"type": "http.response.body", "body": response.body})
+
+        try:
+            response_headers = downstream_response_headers(response.headers.multi_items())
+            if timing is not None:
+                response_headers.append((b"server-timing", timing))
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers,
+            })
+            if body is not None and not body.complete:
+                # 上游提前响应时请求体还没读完，此时不能再监听下游断开
+                await send_body(response, send)
+            else:
+                await self.stream_until_disconnect(response, receive, send)
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    async def stream_until_disconnect(response: httpx.Response, receive: Receive, send: Send):
+        """转发响应体，下游断开时立即停止读取上游（对 SSE 等长连接尤其重要）"""
+        sender = asyncio.ensure_future(send_body(response, send))
+        watcher = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            await asyncio.wait((sender, watcher), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            watcher.cancel()
+            await asyncio.gather(sender, watcher, return_exceptions=True)
+
+        if not sender.cancelled():
+            # 抛出转发过程中的异常（如上游读取失败）
+            sender.result()
@@ -0,0 +1,177 @@
+import math
+import time
+import bisect
+import random
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+from models.base import BalanceConfig, Group
+
+# EWMA 平滑系数，越大越偏向最近的延迟
+EWMA_ALPHA = 0.3
+# 一段时间没有被选中的后端，其 EWMA 按该时间常数（秒）衰减，避免慢过一次就再也选不到
+EWMA_DECAY = 10.0
+# 一致性哈希环上每单位权重的虚拟节点数
+HASH_REPLICAS = 100
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+def _get_cookie(cookie_header: str, name: str) -> Optional[str]:
+    for part in cookie_header.split(";"):
+        key, _, value = part.strip().partition("=")
+        if key == name:
+            return value
+    return None
+
+
+class Balancer:
+    """组内多个后端之间的负载均衡
+
+    + round_robin：轮询
+    + weighted：平滑加权轮询（与 nginx 相同）
+    + least_requests：进行中请求数 / 权重最小
+    + p2c_ewma：随机取两个后端，比较 EWMA 延迟 × (进行中请求数 + 1)
+    + hash：按请求头或 Cookie 做一致性哈希，实现会话粘滞，取不到时退化为轮询
+
+    只在代理所在的事件循环中使用，无需加锁。
+    """
+
+    def __init__(self, group: Group):
+        self.config = group.balance or BalanceConfig()
+        self.signature_key = self.signature(group)
+        self.urls = [backend.url for backend in group.backends]
+        self.weights = [backend.weight for backend in group.backends]
+        self.outstanding = [0] * len(self.urls)  # 每个后端进行中的请求数
+        self.ewma = [0.0] * len(self.urls)  # 每个后端响应头延迟的 EWMA（秒）
+        self.observed_at = [0.0] * len(self.urls)  # 最近一次更新 EWMA 的时间
+        self.down = set()  # 健康检查判定为异常的后端
+        self.ejected = set()  # 被动异常检测摘除（熔断中）的后端
+        self.candidates = []
+        self._update_candidates()
+
+        self._rr = 0
+        self._current_weights = [0] * len(self.urls)
+        self._ring: List[Tuple[int, int]] = []
+        self._ring_keys: List[int] = []
+        if self.config.strategy == "hash":
+            self._build_ring()
+
+        self._hash_header = (self.config.hash_header or "").lower()
+        self._choose = getattr(self, f"_choose_{self.config.strategy}")
+
+    @staticmethod
+    def signature(group: Group) -> tuple:
+        """后端列表或均衡配置变化时才需要重建（重建会丢失统计数据）"""
+        return group.balance, tuple((backend.url, backend.weight) for backend in group.backends)
+
+    def choose(self, headers: Iterable[Tuple[str, str]]) -> Optional[int]:
+        """选择本次请求使用的后端下标，没有可用后端时返回 None"""
+        if not self.candidates:
+            return None
+        if len(self.candidates) == 1:
+            return self.candidates[0]
+        return self._choose(headers)
+
+    def set_down(self, idx: int, down: bool):
+        """标记后端异常 / 恢复，异常的后端不再参与选择"""
+        if idx >= len(self.urls) or (idx in self.down) == down:
+            return
+        if down:
+            self.down.add(idx)
+        else:
+            self.down.discard(idx)
+        self._update_candidates()
+
+    def set_ejected(self, idx: int, ejected: bool):
+        """摘除 / 恢复熔断中的后端"""
+        if idx >= len(self.urls) or (idx in self.ejected) == ejected:
+            return
+        if ejected:
+            self.ejected.add(idx)
+        else:
+            self.ejected.discard(idx)
+        self._update_candidates()
+
+    def _update_candidates(self):
+        weighted = [idx for idx, weight in enumerate(self.weights) if weight > 0]
+        # 健康检查全部异常时仍然尝试所有后端，好过直接拒绝请求
+        healthy = [idx for idx in weighted if idx not in self.down] or weighted
+        # 熔断中的后端不参与选择，全部熔断时直接快速失败
+        self.candidates = [idx for idx in healthy if idx not in self.ejected]
+        self._candidate_set = set(self.candidates)
+
+    def acquire(self, idx: int):
+        self.outstanding[idx] += 1
+
+    def release(self, idx: int):
+        self.outstanding[idx] -= 1
+
+    def observe(self, idx: int, latency: float):
+        """记录上游响应头的延迟"""
+        self.observed_at[idx] = time.monotonic()
+        if self.ewma[idx] == 0.0:
+            self.ewma[idx] = latency
+        else:
+            self.ewma[idx] += EWMA_ALPHA * (latency - self.ewma[idx])
+
+    def _choose_round_robin(self, headers) -> int:
+        idx = self.candidates[self._rr % len(self.candidates)]
+        self._rr += 1
+        return idx
+
+    def _choose_weighted(self, headers) -> int:
+        total = 0
+        best = None
+        for idx in self.candidates:
+            self._current_weights[idx] += self.weights[idx]
+            total += self.weights[idx]
+            if best is None or self._current_weights[idx] > self._current_weights[best]:
+                best = idx
+        self._current_weights[best] -= total
+        return best
+
+    def _choose_least_requests(self, headers) -> int:
+        return min(self.candidates, key=lambda idx: (self.outstanding[idx] / self.weights[idx], random.random()))
+
+    def _choose_p2c_ewma(self, headers) -> int:
+        first, second = random.sample(self.candidates, 2)
+        if self._cost(second) < self._cost(first):
+            return second
+        return first
+
+    def _cost(self, idx: int) -> float:
+        ewma = self.ewma[idx] * math.exp((self.observed_at[idx] - time.monotonic()) / EWMA_DECAY)
+        return ewma * (self.outstanding[idx] + 1) / self.weights[idx]
+
+    def _choose_hash(self, headers) -> int:
+        key = self._hash_key(headers)
+        if key is None or not self._ring:
+            return self._choose_round_robin(headers)
+        pos = bisect.bisect(self._ring_keys, _hash(key))
+        # 顺时针找到第一个可用的后端，异常后端上的会话只迁移到相邻节点
+        for offset in range(len(self._ring)):
+            idx = self._ring[(pos + offset) % len(self._ring)][1]
+            if idx in self._candidate_set:
+                return idx
+        return self._choose_round_robin(headers)
+
+    def _hash_key(self, headers) -> Optional[str]:
+        for name, value in headers:
+            name = name.lower()
+            if self._hash_header and name == self._hash_header:
+                return value
+            if self.config.hash_cookie and name == "cookie":
+                value = _get_cookie(value, self.config.hash_cookie)
+                if value is not None:
+                    return value
+        return None
+
+    def _build_ring(self):
+        for idx, weight in enumerate(self.weights):
+            for replica in range(HASH_REPLICAS * weight):
+                self._ring.append((_hash(f"{self.urls[idx]}#{replica}"), idx))
+        self._ring.sort()
+        self._ring_keys = [key for key, _ in self._ring]
@@ -1,158 +1,920 @@
-import logging
-import sys
-
 import httpx
 import asyncio
 import uvicorn
-from typing import Dict, List, Optional
-from collections import defaultdict
-from models.base import Group, Backend, Proxy
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+import time
+import socket
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from models.base import Group, Proxy
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
-from utils.base import join_url, LOGGER
+from proxy.admin import AdminApp
+from proxy.asgi import ForwardApp
+from proxy.balancer import Balancer
+from proxy.cache import CachedResponse, CacheEntry, ResponseCache
+from proxy.coalesce import Coalescer
+from proxy.headers import upstream_request_headers, downstream_response_headers
+from proxy.limit import Limiter, Overloaded
+from proxy.listener import Listener, PortListener, Server
+from proxy.metrics import Metrics
+from proxy.health import HealthChecker
+from proxy.outlier import OutlierDetector
+from proxy.pool import ClientPool
+from proxy.retry import RetryPolicy, RETRY_METHODS, HEDGE_METHODS
+from proxy.router import Route, RouteTable
+from proxy.stream import request_content, iter_response_body, ClosingStream
+from proxy.timeouts import DeadlineExceeded, remaining, request_deadline, with_deadline_header
+from proxy.trace import CURRENT as CURRENT_TRACE, RequestTrace, TraceLog, note
+from utils.base import LOGGER
 
 
-def get_current_backend(group: Group, row: int) -> Optional[str]:
-    if 0 <= row < len(group.backends):
-        return group.backends[row].url
-    return None
+# 排空期间发出 drain 事件的间隔（秒）
+DRAIN_REPORT_INTERVAL = 1.0
 
 
 class ProxyServer:
-    def __init__(self, proxys: List[Proxy]):
+    def __init__(
+            self,
+            proxys: List[Proxy],
+            lean: bool = False,
+            sockets: Dict[int, socket.socket] = None,
+            admin_port: Optional[int] = None,
+            drain_timeout: float = 30.0
+    ):
+        self.lean = lean  # 使用纯 ASGI 转发应用，不经过 FastAPI
+        self.sockets = sockets  # 多进程模式下由主进程预先绑定的监听套接字
+        self.admin_port = admin_port  # 管理端口（指标等），为空时不启动也不记录指标
+        self.admin: Optional[Server] = None
+        self.metrics = Metrics(self) if admin_port is not None else None
         self.servers: Dict[int, List[Group]] = { proxy.port: proxy.groups for proxy in proxys }
-        self.apps = {}  # 存储每个端口对应的FastAPI实例
-        
-        # 为每个端口创建FastAPI实例
-        for port in self.servers.keys():
-            self.create_server(port)
-
-    def create_server(self, port: int):
-        app = FastAPI()
-        app.middleware("http")(self.proxy_middleware)
+        self.drain_timeout = drain_timeout  # 停止端口时等待进行中的请求完成的最长时间（秒），超时后强制关闭
+        self.draining: Dict[asyncio.Task, Tuple[int, PortListener]] = {}  # 正在排空的端口：排空任务 -> (端口, 监听器)
+        self.stopped = asyncio.Event()  # 调用了 shutdown，或所有端口都监听失败、服务器意外退出
+        self.clients = ClientPool()  # 上游长连接客户端
+        self.routes: Dict[int, RouteTable] = {}  # 每个端口编译好的路由表
+        self.balancers: Dict[Tuple[int, str], Balancer] = {}  # 配置了负载均衡的组
+        self.caches: Dict[Tuple[int, str], ResponseCache] = {}  # 配置了响应缓存的组
+        self.coalescers: Dict[Tuple[int, str], Coalescer] = {}  # 配置了请求合并的组
+        self.retries: Dict[Tuple[int, str], RetryPolicy] = {}  # 配置了重试与对冲的组
+        self.limiters: Dict[Tuple[int, str], Limiter] = {}  # 配置了准入控制的组
+        self.traces: Dict[Tuple[int, str], TraceLog] = {}  # 配置了请求计时的组
+        self.listeners: List[Callable[[str, dict], None]] = []  # 事件监听（如界面）
+        self.health = HealthChecker(self)  # 后台主动健康检查
+        self.outliers = OutlierDetector(self)  # 根据真实请求结果熔断异常后端
+        self.rebuild_routes()
+        # 所有端口共用一个服务器，端口只是其上的监听套接字
+        self.listener = self.create_listener()
+
+    def rebuild_routes(self):
+        """根据 servers 重新编译路由表，整体替换引用以保证请求读到的总是完整的路由表"""
+        balancers = {}
+        caches = {}
+        coalescers = {}
+        retries = {}
+        limiters = {}
+        traces = {}
+        for port, groups in self.servers.items():
+            for group in groups:
+                if group.trace is not None:
+                    # 配置不变时保留已记录的慢请求
+                    log = self.traces.get((port, group.path))
+                    if log is None or log.config != group.trace:
+                        log = TraceLog(port, group.path, group.trace)
+                    traces[(port, group.path)] = log
+
+                if group.limit is not None:
+                    # 配置不变时沿用原来的计数，进行中的请求结束后仍归还给创建时的限制器
+                    limiter = self.limiters.get((port, group.path))
+                    if limiter is None or Limiter.signature(group) != limiter.signature_key:
+                        limiter = Limiter(group)
+                    limiters[(port, group.path)] = limiter
+
+                if group.retry is not None:
+                    policy = self.retries.get((port, group.path))
+                    if policy is None or policy.config != group.retry:
+                        policy = RetryPolicy(group.retry)
+                    retries[(port, group.path)] = policy
+
+                if group.coalesce is not None:
+                    coalescer = self.coalescers.get((port, group.path))
+                    if coalescer is None or coalescer.config != group.coalesce:
+                        coalescer = Coalescer(group.coalesce)
+                    coalescers[(port, group.path)] = coalescer
+
+                if group.cache is not None:
+                    # 缓存配置不变时保留已缓存的响应（缓存键包含后端地址，切换后端不会命中旧响应）
+                    cache = self.caches.get((port, group.path))
+                    if cache is None or cache.config != group.cache:
+                        cache = ResponseCache(group.cache)
+                    caches[(port, group.path)] = cache
+
+                if group.balance is None:
+                    continue
+                # 后端与均衡配置不变时沿用原来的均衡器，保留计数与延迟统计
+                balancer = self.balancers.get((port, group.path))
+                if balancer is None or Balancer.signature(group) != balancer.signature_key:
+                    balancer = Balancer(group)
+                balancers[(port, group.path)] = balancer
+
+        self.balancers = balancers
+        self.caches = caches
+        self.coalescers = coalescers
+        self.retries = retries
+        self.limiters = limiters
+        self.traces = traces
+        # 编译每个组的运行时快照，组对象与状态都没变的沿用旧快照，只重建有变化的端口的路由表
+        routes = {}
+        for port, groups in self.servers.items():
+            table = self.routes.get(port)
+            compiled = {id(route.group): route for route in table.routes} if table is not None else {}
+            port_routes = []
+            for group in groups:
+                key = (port, group.path)
+                route = Route(
+                    port, group, self.clients.get(port, group), balancers.get(key), caches.get(key),
+                    coalescers.get(key), retries.get(key), limiters.get(key), traces.get(key)
+                )
+                previous = compiled.get(id(group))
+                port_routes.append(previous if previous is not None and previous.same(route) else route)
+            routes[port] = table if table is not None and table.serves(port_routes) else RouteTable(port_routes)
+        # 整体替换引用，请求读到的总是同一时刻编译的完整快照
+        self.routes = routes
+
+        # 新建的均衡器沿用已有的健康检查与熔断状态，并为新配置的组启动检查
+        self.outliers.sync()
+        for port, groups in self.servers.items():
+            for group in groups:
+                self.health.apply(port, group)
+                self.outliers.apply(port, group)
+        self.health.sync()
+
+    def find_group(self, port: int, path: str) -> Optional[Group]:
+        for group in self.servers.get(port, []):
+            if group.path == path:
+                return group
+        return None
+
+    def create_listener(self) -> Listener:
+        if self.lean:
+            app = ForwardApp(self)
+        else:
+            # 延迟导入，纯 ASGI 模式下不需要加载 FastAPI，启动更快
+            from fastapi import FastAPI
+
+            app = FastAPI()
+            app.middleware("http")(self.proxy_middleware)
         config = uvicorn.Config(
-            app, 
-            host="0.0.0.0", 
-            port=port,
+            app,
             log_level="error",  # 只显示错误日志
             log_config=None,
-            access_log=False
+            access_log=False,
+            server_header=False,  # 透传上游的 Server / Date 头
+            date_header=False,
+            timeout_graceful_shutdown=self.drain_timeout
         )
-        server = uvicorn.Server(config)
-        self.apps[port] = server
-        return server
+        return Listener(config)
 
     async def start_servers(self):
-        """启动所有端口的服务器"""
-        tasks = []
-        for port, server in self.apps.items():
-            task = asyncio.create_task(server.serve())
-            tasks.append(task)
-        
-        # 使用asyncio同时启动所有服务器
-        await asyncio.gather(*tasks)
+        """监听所有端口，调用 shutdown 后等所有端口排空再返回并释放上游连接
+
+        所有端口都监听失败（如端口被占用）时也会返回。
+        """
+        if await self.listener.start():
+            self.open_ports()
+            if self.servers and not self.listener.ports:
+                self.stopped.set()
+        # 服务器意外退出时不再等待 shutdown
+        self.listener.task.add_done_callback(lambda _: self.stopped.set())
+        self.health.start()
+        admin = asyncio.create_task(self.serve_admin()) if self.admin_port is not None else None
+
+        try:
+            await self.stopped.wait()
+            # 排空期间仍可以通过管理端口查看进度
+            while self.draining:
+                await asyncio.gather(*self.draining, return_exceptions=True)
+        finally:
+            await self.listener.stop()
+            if admin is not None:
+                if self.admin is not None:
+                    self.admin.should_exit = True
+                await admin
+            await self.health.stop()
+            await self.clients.close()
+
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        """注册事件监听，事件在代理所在的线程中回调"""
+        self.listeners.append(listener)
+
+    def emit(self, event: str, **data):
+        """通知监听者，如 backend（当前后端变化）、health（健康检查结果）"""
+        for listener in self.listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                LOGGER.error(f"事件 {event} 处理失败: {e}")
+
+    def add_group(self, port: int, group: Group):
+        """添加转发组，端口不存在时启动新的服务器"""
+        self.servers.setdefault(port, []).append(group)
+        self.restart_server()
+
+    def update_group(self, port: int, group: Group):
+        """按路径替换转发组（如后端列表或当前后端变化）"""
+        if port not in self.servers:
+            return self.add_group(port, group)
+
+        groups = self.servers[port]
+        for idx, _group in enumerate(groups):
+            if _group.path == group.path:
+                groups[idx] = group
+                break
+        else:
+            groups.append(group)
+        self.rebuild_routes()
+
+    def set_current_backend(self, port: int, group: Group, row: int):
+        """切换组的当前后端：不修改原来的组对象，替换为副本后重新编译快照，进行中的请求仍使用原来的快照"""
+        self.update_group(port, group.model_copy(update={"current_backend": row}))
+        self.emit("backend", port=port, path=group.path, current_backend=row)
+
+    def remove_group(self, port: int, path: str):
+        """删除转发组，端口下没有组时停止该端口的服务器"""
+        groups = [group for group in self.servers.get(port, []) if group.path != path]
+        if groups:
+            self.servers[port] = groups
+        else:
+            self.servers.pop(port, None)
+        # 与 reload 一致，进行中的请求结束后释放该组的连接池
+        self.clients.retire(port, path)
+        self.restart_server()
+
+    def shutdown(self):
+        """停止所有端口：不再接受新连接，进行中的请求完成（最多等待 drain_timeout 秒）后 start_servers 返回"""
+        for port in list(self.listener.ports):
+            self.stop_server(port)
+        self.stopped.set()
+
+    def reload(self, proxys: List[Proxy]):
+        """使用新的配置替换当前的转发规则
+
+        配置没有变化的组沿用原来的对象，它的均衡器、缓存、限流等状态和连接池随之保留；
+        只重建组有变化的端口的路由表，只有端口增减时才启动或停止监听，进行中的请求不受影响。
+        """
+        servers: Dict[int, List[Group]] = {}
+        changed = 0
+        for proxy in proxys:
+            running = {group.path: group for group in self.servers.get(proxy.port, [])}
+            groups = servers.setdefault(proxy.port, [])
+            for group in proxy.groups or []:
+                _group = running.pop(group.path, None)
+                if _group is not None and _group == group:
+                    groups.append(_group)
+                else:
+                    groups.append(group)
+                    changed += 1
+            # 已删除的组，进行中的请求结束后释放它的连接池
+            for path in running:
+                self.clients.retire(proxy.port, path)
+                changed += 1
+        for port in set(self.servers) - set(servers):
+            changed += len(self.servers[port])
+
+        started = sorted(set(servers) - set(self.servers))
+        stopped = sorted(set(self.servers) - set(servers))
+        self.servers = servers
+        self.restart_server()
+        LOGGER.info(f"配置已更新：{changed} 个组有变化，新增端口 {started or '无'}，停止端口 {stopped or '无'}")
 
     def restart_server(self):
-        """重启代理服务器"""
-        stop_servers = [] # 将要停止的服务器
-        new_servers = [] # 将要新启动的服务器
-        
-        # 找出需要停止的服务器（在self.apps中存在但在self.servers中不存在的端口）
-        for port in self.apps.keys():
+        """按 servers 增减监听的端口"""
+        self.rebuild_routes()
+
+        for port in list(self.listener.ports):
             if port not in self.servers:
-                stop_servers.append(port)
-        
-        # 找出需要新启动的服务器（在self.servers中存在但在self.apps中不存在的端口）
-        for port in self.servers.keys():
-            if port not in self.apps:
-                # 创建新的FastAPI实例
-                self.create_server(port)
-                new_servers.append(port)
-        
-        # 停止需要停止的服务器
-        for port in stop_servers:
-            asyncio.create_task(self.stop_server(port))
-        
-        # 启动新的服务器
-        for port in new_servers:
-            server = self.create_server(port)
-            asyncio.create_task(server.serve())
-
-    async def stop_server(self, port: int):
-        """关闭指定端口的服务器"""
-        if port in self.apps:
-            server = self.apps[port]
-            # 关闭所有连接
-            await server.shutdown()
-            # 从字典中移除
-            del self.apps[port]
-            LOGGER.info(f"停止端口 {port} 的服务器")
+                self.stop_server(port)
+        # 服务器启动前添加的端口由 start_servers 统一开始监听
+        if self.listener.started:
+            self.open_ports()
 
-    async def proxy_middleware(self, request: Request, call_next):
-        # 获取当前端口对应的组
-        port = request.url.port
-        groups = self.servers.get(port, [])
-        
-        # 获取请求路径
-        path = request.url.path
-        
-        # 查找匹配的组
-        target_group = None
-        for group in groups:
-            if path.startswith(group.path):
-                target_group = group
-                break
+    def open_ports(self):
+        """开始监听已配置但尚未监听的端口，有预先绑定的套接字时直接使用"""
+        for port in self.servers:
+            if port in self.listener.ports:
+                continue
+            sock = None
+            if self.sockets is not None:
+                sock = self.sockets.get(port)
+                if sock is None:
+                    LOGGER.warning(f"端口 {port} 没有预先绑定的套接字，需由主进程重启工作进程后生效")
+                    continue
+            try:
+                self.listener.open(port, sock)
+            except OSError as e:
+                # 未加入监听列表，重新加载配置时会再次尝试
+                LOGGER.error(f"端口 {port} 监听失败，端口可能已被占用: {e}")
+
+    async def serve_admin(self):
+        """运行管理端口的服务器"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # 多进程模式下轮换工作进程时，新旧进程可以短暂地同时监听
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind(("0.0.0.0", self.admin_port))
+        except OSError as e:
+            sock.close()
+            LOGGER.error(f"管理端口 {self.admin_port} 绑定失败: {e}")
+            return
+
+        config = uvicorn.Config(
+            AdminApp(self),
+            log_level="error",
+            log_config=None,
+            access_log=False
+        )
+        self.admin = Server(config)
+        LOGGER.info(f"管理端口: {self.admin_port}")
+        try:
+            await self.admin.serve(sockets=[sock])
+        finally:
+            sock.close()
+
+    def stop_server(self, port: int):
+        """开始排空指定端口：立即关闭监听套接字（排空过程中端口又被添加时可以重新监听），
+        关闭该端口上空闲的长连接，进行中的请求完成后连接随之关闭
+        """
+        listener = self.listener.close(port)
+        if listener is None:
+            return
+        drain = asyncio.create_task(self.drain(port, listener))
+        self.draining[drain] = (port, listener)
+        drain.add_done_callback(self._drained)
+
+    async def drain(self, port: int, listener: PortListener):
+        """等待端口排空（超过 drain_timeout 时取消进行中的请求并断开连接），期间定期发出 drain 事件"""
+        start = time.monotonic()
+        connections = len(self.listener.connections(listener))
+        LOGGER.info(f"端口 {port} 开始排空，进行中的连接 {connections} 个")
+        waiter = asyncio.ensure_future(self.listener.drain(listener, self.drain_timeout))
+        try:
+            while not waiter.done():
+                connections = len(self.listener.connections(listener))
+                self.emit("drain", port=port, connections=connections, elapsed=time.monotonic() - start, done=False)
+                await asyncio.wait((waiter,), timeout=DRAIN_REPORT_INTERVAL)
+        finally:
+            waiter.cancel()
+        dropped = waiter.result()
+
+        elapsed = time.monotonic() - start
+        if dropped:
+            LOGGER.warning(f"端口 {port} 排空超时，强制关闭剩余的 {dropped} 个连接")
+        # 端口没有被重新添加时再释放上游连接
+        if port not in self.servers:
+            await self.clients.close(port)
+        self.emit("drain", port=port, connections=0, elapsed=elapsed, done=True)
+        LOGGER.info(f"停止端口 {port} 的服务器（排空用时 {elapsed:.1f} 秒）")
+
+    def _drained(self, task: asyncio.Task):
+        self.draining.pop(task, None)
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.error(f"停止端口失败: {task.exception()}")
+
+    def match_target(
+            self,
+            port: int,
+            path: str,
+            headers: Iterable[Tuple[str, str]]
+    ) -> Tuple[Optional[Route], Optional[int], Optional[str]]:
+        """查找请求对应的组快照、后端下标和目标URL
+
+        没有匹配的组或组未启用后端时返回 (None, None, None)；
+        启用的后端不存在时返回 (组, None, None)。
+        配置了负载均衡的组由均衡器选择后端，否则使用当前启用的后端。
+        """
+        # 只读取一次路由表引用，之后的转发过程都使用同一份快照
+        routes = self.routes.get(port)
+
+        # 查找最长前缀匹配的组
+        route = routes.match(path) if routes else None
+        if route is None:
+            return None, None, None
+
+        if route.balancer is not None:
+            row = route.balancer.choose(headers)
+        else:
+            row = route.current_backend
+        if row is None:
+            return None, None, None
+
+        if not route.backend(row):
+            return route, None, None
+
+        # 后端熔断中，直接快速失败
+        if route.outlier is not None and not self.outliers.allow(route, row):
+            return None, None, None
+
+        # 构建目标URL（移除组路径前缀）
+        return route, row, route.target_url(row, path[route.prefix:])
+
+    @staticmethod
+    def start_trace(route: Route, method: str, path: str, start: float) -> Optional[RequestTrace]:
+        """组配置了请求计时时开始记录，start 为开始路由匹配的时间"""
+        if route.trace is None:
+            return None
+        return route.trace.start(method, path, start)
+
+    async def fetch(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            trace: Optional[RequestTrace] = None
+    ) -> Union[CachedResponse, httpx.Response]:
+        """转发请求，trace 不为空时记录各阶段耗时（由 start_trace 创建）
+
+        整体截止时间在这里确定一次，之后的排队、合并等待、重试和对冲共用，每次发送只使用剩余的时间。
+        """
+        deadline = request_deadline(route.timeout, headers)
+        if trace is None:
+            return await self.fetch_metered(route, row, method, path, url, query, headers, content, deadline)
 
+        token = CURRENT_TRACE.set(trace)
         try:
-            port = int(target_group.current_backend)
-        except:
+            response = await self.fetch_metered(route, row, method, path, url, query, headers, content, deadline)
+        except BaseException as e:
+            trace.finish(e)
+            raise
+        finally:
+            CURRENT_TRACE.reset(token)
+        trace.responded(response)
+        return response
+
+    async def fetch_metered(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            deadline: Optional[float]
+    ) -> Union[CachedResponse, httpx.Response]:
+        """启用管理端口时记录指标"""
+        if self.metrics is None:
+            return await self.fetch_admitted(route, row, method, path, url, query, headers, content, deadline)
+
+        stats = self.metrics.backend(route.port, route.path, route.urls[row])
+        content = stats.started(content)
+        start = time.perf_counter()
+        try:
+            response = await self.fetch_admitted(route, row, method, path, url, query, headers, content, deadline)
+        except BaseException as e:
+            stats.failed(e, start)
+            raise
+        stats.responded(response, start)
+        return response
+
+    async def fetch_admitted(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            deadline: Optional[float]
+    ) -> Union[CachedResponse, httpx.Response]:
+        """组配置了准入控制时先取得许可（超过容量抛出 Overloaded，排队到截止时间抛出 DeadlineExceeded），许可在响应关闭后归还"""
+        limiter = route.limiter
+        if limiter is None:
+            return await self.fetch_shared(route, row, method, path, url, query, headers, content, deadline)
+
+        queued = time.perf_counter()
+        try:
+            await limiter.acquire(row, deadline)
+        except (Overloaded, DeadlineExceeded):
+            self.outliers.abort(route, row)
+            raise
+        trace = CURRENT_TRACE.get()
+        if trace is not None:
+            trace.add("queue", time.perf_counter() - queued)
+        try:
+            response = await self.fetch_shared(route, row, method, path, url, query, headers, content, deadline)
+        except BaseException:
+            limiter.release(row)
+            raise
+        if isinstance(response, CachedResponse):
+            limiter.release(row)
+        else:
+            response.stream = ClosingStream(response.stream, lambda: limiter.release(row))
+        return response
+
+    async def fetch_shared(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            deadline: Optional[float]
+    ) -> Union[CachedResponse, httpx.Response]:
+        """组配置了响应缓存时先查缓存，配置了请求合并时相同的请求只转发一次
+
+        缓存命中或共享到其他请求的响应时直接返回 CachedResponse，不访问上游；
+        否则返回上游响应，由调用方逐块读取后关闭。
+        """
+        # 未配置负载均衡时各后端可能是不同的环境，缓存与合并都按后端区分
+        extra = () if route.balanced else (route.urls[row],)
+
+        cache = route.cache
+        key = entry = None
+        if cache is not None:
+            key, entry, fresh = cache.lookup(method, path, query, headers, *extra)
+            if fresh:
+                # 没有访问后端，半开状态的试探机会留给下一个请求
+                self.outliers.abort(route, row)
+                note("cache", "hit")
+                return entry.respond(method, headers)
+
+        coalescer = route.coalescer
+        flight_key = coalescer.key(method, path, query, headers, *extra) if coalescer is not None else None
+        if flight_key is None:
+            return await self.forward_upstream(route, row, method, path, url, query, headers, content, cache, key, entry, deadline)
+
+        flight = coalescer.join(flight_key)
+        if flight is not None:
+            try:
+                shared = await coalescer.wait(flight, deadline)
+            except DeadlineExceeded:
+                self.outliers.abort(route, row)
+                raise
+            if shared is not None:
+                self.outliers.abort(route, row)
+                note("coalesce", "shared")
+                return shared
+            # 无法共享（响应不可共享、响应体过大或第一个请求被中断），自行转发
+            return await self.forward_upstream(route, row, method, path, url, query, headers, content, cache, key, entry, deadline)
+
+        if flight_key in coalescer.flights:
+            # 等待者已满
+            return await self.forward_upstream(route, row, method, path, url, query, headers, content, cache, key, entry, deadline)
+
+        flight = coalescer.lead(flight_key)
+        try:
+            response = await self.forward_upstream(route, row, method, path, url, query, headers, content, cache, key, entry, deadline)
+        except BaseException as e:
+            coalescer.fail(flight_key, flight, e)
+            raise
+        coalescer.share(flight_key, flight, response)
+        return response
+
+    async def forward_upstream(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            cache: Optional[ResponseCache],
+            key: Optional[tuple],
+            entry: Optional[CacheEntry],
+            deadline: Optional[float]
+    ) -> Union[CachedResponse, httpx.Response]:
+        """向上游转发，有缓存时用过期条目重新验证，可缓存的响应在转发完成后写入缓存"""
+        if cache is None or key is None:
+            return await self.send_with_retries(route, row, method, path, url, query, headers, content, deadline)
+
+        upstream_headers = headers
+        if entry is not None and entry.revalidatable:
+            upstream_headers = cache.conditional_headers(entry, headers)
+        response = await self.send_with_retries(route, row, method, path, url, query, upstream_headers, content, deadline)
+
+        if entry is not None and response.status_code == 304 and upstream_headers is not headers:
+            await response.aclose()
+            note("cache", "revalidated")
+            return cache.revalidated(key, entry, response).respond(method, headers)
+        cache.store(key, headers, response)
+        return response
+
+    def next_backend(self, route: Route, tried: List[int]) -> Optional[int]:
+        """按顺序找到下一个未尝试过、健康且未被摘除的后端"""
+        count = len(route.urls)
+        for offset in range(1, count + 1):
+            idx = (tried[-1] + offset) % count
+            if idx in tried:
+                continue
+            if route.balanced and route.weights[idx] == 0:
+                continue
+            if not self.health.is_healthy(route.port, route.path, route.urls[idx]):
+                continue
+            if self.outliers.is_ejected(route, idx):
+                continue
+            return idx
+        return None
+
+    async def send_with_retries(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            deadline: Optional[float]
+    ) -> httpx.Response:
+        """向上游发送请求，组配置了重试时在连接失败后换到下一个后端重试，并按延迟百分位发出对冲请求
+
+        带请求体的请求无法重放，只发送一次。重试与对冲都受重试预算限制。
+        """
+        policy = route.retry
+        if policy is None or content is not None or method not in RETRY_METHODS:
+            return await self.open_upstream(route, row, method, url, query, headers, content, deadline)
+
+        policy.deposit()
+        target_path = path[route.prefix:]
+        tried = [row]
+        while True:
+            try:
+                return await self.send_hedged(policy, route, tried, method, target_path, url, query, headers, deadline)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if len(tried) > policy.config.attempts or not policy.withdraw():
+                    raise
+            # 只有一个可用后端时重试同一个后端
+            row = self.next_backend(route, tried)
+            if row is None:
+                row = tried[-1]
+            tried.append(row)
+            url = route.target_url(row, target_path)
+            policy.retried += 1
+
+    async def send_hedged(
+            self,
+            policy: RetryPolicy,
+            route: Route,
+            tried: List[int],
+            method: str,
+            target_path: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            deadline: Optional[float]
+    ) -> httpx.Response:
+        """发送请求，超过对冲等待时间仍未收到响应头时向下一个后端再发一次，先响应的胜出，另一个取消"""
+        row = tried[-1]
+        start = time.perf_counter()
+        delay = policy.hedge_delay() if method in HEDGE_METHODS else None
+        if delay is None:
+            response = await self.open_attempt(route, tried[0], row, method, url, query, headers, deadline)
+            policy.observe(time.perf_counter() - start)
+            return response
+
+        tasks = [asyncio.ensure_future(self.open_attempt(route, tried[0], row, method, url, query, headers, deadline))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            hedge_row = None if done else self.next_backend(route, tried)
+            if hedge_row is not None and policy.withdraw():
+                policy.hedged += 1
+                tried.append(hedge_row)
+                hedge_url = route.target_url(hedge_row, target_path)
+                tasks.append(asyncio.ensure_future(
+                    self.open_attempt(route, tried[0], hedge_row, method, hedge_url, query, headers, deadline, hedge=True)
+                ))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                if winner is not None:
+                    break
+            if winner is None:
+                # 都失败时抛出原请求的异常
+                return tasks[0].result()
+
+            if winner is not tasks[0]:
+                policy.hedge_wins += 1
+            policy.observe(time.perf_counter() - start)
+            return winner.result()
+        finally:
+            await self.cancel_upstream(*(task for task in tasks if task is not winner))
+
+    async def open_attempt(
+            self,
+            route: Route,
+            admitted: int,
+            row: int,
+            method: str,
+            url: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            deadline: Optional[float],
+            hedge: bool = False
+    ) -> httpx.Response:
+        """发送重试或对冲的一次尝试，与原请求一样经过准入控制，许可在响应关闭后归还
+
+        admitted 为原请求取得许可的后端。对冲额外增加了并发，需要完整的许可（限速、组与后端的并发上限、排队）；
+        重试接替已经失败的尝试，组的名额沿用原请求的，只有换到其他后端时占用该后端的名额。
+        """
+        limiter = route.limiter
+        if limiter is None or (not hedge and row == admitted):
+            return await self.open_upstream(route, row, method, url, query, headers, None, deadline)
+
+        if hedge:
+            await limiter.acquire(row, deadline)
+            release = lambda: limiter.release(row)
+        else:
+            limiter.acquire_backend(row)
+            release = lambda: limiter.release_backend(row)
+        try:
+            response = await self.open_upstream(route, row, method, url, query, headers, None, deadline)
+        except BaseException:
+            release()
+            raise
+        response.stream = ClosingStream(response.stream, release)
+        return response
+
+    @staticmethod
+    async def cancel_upstream(*tasks: asyncio.Task):
+        """取消未胜出的上游请求，已经拿到的响应要关闭以释放连接"""
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                response = await task
+            except BaseException:
+                continue
+            await response.aclose()
+
+    async def open_upstream(
+            self,
+            route: Route,
+            row: int,
+            method: str,
+            url: str,
+            query: bytes,
+            headers: Iterable[Tuple[str, str]],
+            content: Optional[AsyncIterator[bytes]],
+            deadline: Optional[float]
+    ) -> httpx.Response:
+        """向上游发送请求，只等待响应头，响应体由调用方逐块读取后关闭
+
+        连接、读写和连接池超时使用组的客户端配置；deadline 为整体截止时刻，到时未收到响应头抛出 DeadlineExceeded。
+        """
+        # 复用该组的长连接客户端
+        client = route.client
+        upstream_headers = upstream_request_headers(headers)
+        if deadline is not None:
+            upstream_headers = with_deadline_header(route.timeout, upstream_headers, remaining(deadline))
+        upstream_request = client.build_request(
+            method=method,
+            url=httpx.URL(url, query=query) if query else url,
+            headers=upstream_headers,
+            content=content
+        )
+        tracer = None
+        if self.metrics is not None:
+            stats = self.metrics.backend(route.port, route.path, route.urls[row])
+            tracer = stats.tracer(upstream_request.url.scheme == "https")
+        trace = CURRENT_TRACE.get()
+        if trace is not None:
+            trace.backend = route.urls[row]
+            tracer = trace.tracer(tracer)
+        if tracer is not None:
+            upstream_request.extensions["trace"] = tracer
+
+        balancer = route.balancer
+        if balancer is None and route.outlier is None:
+            return await self.send_upstream(client, upstream_request, deadline)
+
+        # 负载均衡需要统计进行中的请求数（到响应关闭为止）和响应头延迟，异常检测需要请求结果
+        if balancer is not None:
+            balancer.acquire(row)
+        start = time.perf_counter()
+        try:
+            response = await self.send_upstream(client, upstream_request, deadline)
+        except BaseException as e:
+            if balancer is not None:
+                balancer.release(row)
+            if isinstance(e, httpx.TransportError):
+                self.outliers.record(route, row, False)
+            else:
+                self.outliers.abort(route, row)
+            raise
+        latency = time.perf_counter() - start
+        self.outliers.record(route, row, response.status_code < 500, latency)
+        if balancer is not None:
+            balancer.observe(row, latency)
+            response.stream = ClosingStream(response.stream, lambda: balancer.release(row))
+        return response
+
+    @staticmethod
+    async def send_upstream(client: httpx.AsyncClient, request: httpx.Request, deadline: Optional[float]) -> httpx.Response:
+        """发送请求并等待响应头，deadline 为截止时刻（time.monotonic()）"""
+        if deadline is None:
+            return await client.send(request, stream=True)
+        timeout = remaining(deadline)
+        if timeout <= 0:
+            raise DeadlineExceeded("已超过截止时间，未发送请求", request=request)
+        try:
+            return await asyncio.wait_for(client.send(request, stream=True), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("截止时间前未收到上游响应", request=request)
+
+    async def proxy_middleware(self, request: Request, call_next):
+        # 获取当前端口对应的组（使用实际监听的端口，而不是 Host 头中的端口）
+        port = request.scope["server"][1]
+        start = time.perf_counter()
+        route, row, target_url = self.match_target(port, request.url.path, request.headers.items())
+
+        if route is None:
+            if self.metrics is not None:
+                self.metrics.unmatched(port)
             return JSONResponse(content={"error": '无可用或未启用后端服务'}, status_code=503)
 
-        url = get_current_backend(target_group, port)
-        if not target_group or not url:
+        if not target_url:
             return await call_next(request)
-            
-        # 构建目标URL
-        target_path = path[len(target_group.path):]  # 移除组路径前缀
-        target_url = join_url(url, target_path)
-        
+
+        trace = self.start_trace(route, request.method, request.url.path, start)
+
         # 转发请求
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.request(
-                    method=request.method,
-                    url=target_url,
-                    headers=dict(request.headers),
-                    params=dict(request.query_params),
-                    content=await request.body(),
-                    timeout=None
-                )
-                
-                return StreamingResponse(
-                    response.iter_bytes(),
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
-            except ConnectionError as e:
-                return JSONResponse(content={"error": '目标服务器未运行或不可用'}, status_code=503)
-            except Exception as e:
-                return JSONResponse(content={"error": str(e)}, status_code=500)
+        try:
+            response = await self.fetch(
+                route,
+                row,
+                request.method,
+                request.url.path,
+                target_url,
+                request.scope["query_string"],
+                request.headers.items(),
+                request_content(request),
+                trace
+            )
+
+            if isinstance(response, CachedResponse):
+                # 缓存命中，直接返回
+                cached_response = Response(status_code=response.status)
+                cached_response.body = response.body
+                cached_response.raw_headers = response.headers
+                if trace is not None and trace.log.config.server_timing:
+                    cached_response.raw_headers = [*response.headers, (b"server-timing", trace.server_timing())]
+                return cached_response
+
+            streaming_response = StreamingResponse(
+                iter_response_body(response),
+                status_code=response.status_code,
+                background=BackgroundTask(response.aclose)
+            )
+            # 直接使用原始响应头，保留重复头并去掉逐跳头
+            streaming_response.raw_headers = downstream_response_headers(response.headers.multi_items())
+            if trace is not None and trace.log.config.server_timing:
+                streaming_response.raw_headers.append((b"server-timing", trace.server_timing()))
+            return streaming_response
+        except Overloaded as e:
+            return JSONResponse(content={"error": str(e)}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+        except httpx.TimeoutException:
+            return JSONResponse(content={"error": '目标服务器响应超时'}, status_code=504)
+        except (ConnectionError, httpx.ConnectError):
+            return JSONResponse(content={"error": '目标服务器未运行或不可用'}, status_code=503)
+        except Exception as e:
+            return JSONResponse(content={"error": str(e)}, status_code=500)
 
-    async def select_healthy_backend(self, group: Group):
+    async def select_healthy_backend(self, port: int, group: Group):
         """选择一个健康的后端服务"""
         for idx, backend in enumerate(group.backends):
-            if await self.check_backend_health(backend.url):
-                group.current_backend = idx
+            if await self.check_backend_health(backend.url, port, group):
+                self.set_current_backend(port, group, idx)
                 return True
         return False
 
-    @classmethod
-    async def check_backend_health(cls, url: str) -> bool:
-        """检查后端健康状态"""     
-        try:
-            async with httpx.AsyncClient() as client:
-                await client.get(url, timeout=2.0)
-                return True
-        except:
-            return False
+    async def test_backend(self, port: int, path: str, url: str) -> bool:
+        """检查后端健康状态并通知监听者"""
+        is_healthy = await self.check_backend_health(url, port, self.find_group(port, path))
+        self.emit("health", port=port, path=path, url=url, healthy=is_healthy)
+        return is_healthy
+
+    async def check_backend_health(self, url: str, port: int = None, group: Group = None) -> bool:
+        """检查后端健康状态，指定组时复用该组的长连接客户端和健康检查配置"""
+        return await self.health.probe(port, group, url)
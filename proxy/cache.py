@@ -0,0 +1,303 @@
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from models.base import CacheConfig
+from proxy.headers import downstream_response_headers
+from proxy.stream import RecordingStream, has_request_body
+
+CACHEABLE_METHODS = frozenset({"GET", "HEAD"})
+# RFC 9110 15.1 规定默认可缓存的状态码
+CACHEABLE_STATUS = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+# 缓存命中时回复 304 需要带上的头
+NOT_MODIFIED_HEADERS = frozenset({b"cache-control", b"content-location", b"date", b"etag", b"expires", b"vary"})
+# 表明请求属于某个用户的请求头，带这些头的请求只缓存明确允许共享的响应
+CREDENTIAL_HEADERS = frozenset({"authorization", "cookie"})
+# 每个缓存条目除响应体和响应头外的估算开销（字节）
+ENTRY_OVERHEAD = 256
+
+Key = Tuple
+
+
+class CachedResponse(NamedTuple):
+    """缓存命中时直接返回给下游的响应，不经过 httpx"""
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def _seconds(value: Optional[str]) -> Optional[int]:
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def has_credentials(headers: Iterable[Tuple[str, str]]) -> bool:
+    """请求是否带有 Authorization 或 Cookie"""
+    return any(name.lower() in CREDENTIAL_HEADERS for name, _ in headers)
+
+
+def is_shareable(headers: httpx.Headers, credentialed: bool = False) -> bool:
+    """响应能否提供给发出它之外的请求（共享缓存的语义，RFC 9111 第 3 节）
+
+    带 Set-Cookie、Cache-Control: private / no-store 或 Vary: * 的响应不能共享；
+    带 Authorization / Cookie 的请求，只有响应明确允许（public / s-maxage）时才能共享。
+    """
+    if "set-cookie" in headers or headers.get("vary", "").strip() == "*":
+        return False
+    cache_control = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in cache_control or "private" in cache_control:
+        return False
+    if credentialed and "public" not in cache_control and "s-maxage" not in cache_control:
+        return False
+    return True
+
+
+class CacheEntry:
+    __slots__ = ("status", "headers", "body", "vary", "etag", "last_modified", "expires_at", "stored_at", "size")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, vary: tuple, ttl: float):
+        self.status = status
+        self.headers = headers  # 去掉逐跳头后的原始响应头（ASGI 格式）
+        self.body = body
+        self.vary = vary  # 上游 Vary 头列出的请求头及本次请求的值
+        self.etag = self.last_modified = None
+        for key, value in headers:
+            if key == b"etag":
+                self.etag = value.decode("latin-1")
+            elif key == b"last-modified":
+                self.last_modified = value.decode("latin-1")
+        self.size = len(body) + sum(len(key) + len(value) for key, value in headers) + ENTRY_OVERHEAD
+        self.refresh(ttl)
+
+    def refresh(self, ttl: float):
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    @property
+    def revalidatable(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+    def respond(self, method: str, headers: Iterable[Tuple[str, str]]) -> CachedResponse:
+        """构造命中时的响应，下游的条件请求匹配时回复 304"""
+        age = (b"age", str(int(time.monotonic() - self.stored_at)).encode("latin-1"))
+        if self.status == 200 and self._not_modified(headers):
+            return CachedResponse(304, [item for item in self.headers if item[0] in NOT_MODIFIED_HEADERS] + [age], b"")
+        response_headers = [item for item in self.headers if item[0] != b"age"]
+        response_headers.append(age)
+        return CachedResponse(self.status, response_headers, b"" if method == "HEAD" else self.body)
+
+    def _not_modified(self, headers: Iterable[Tuple[str, str]]) -> bool:
+        if_none_match = if_modified_since = None
+        for key, value in headers:
+            key = key.lower()
+            if key == "if-none-match":
+                if_none_match = value
+            elif key == "if-modified-since":
+                if_modified_since = value
+        if if_none_match is not None:
+            if self.etag is None:
+                return False
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+        if if_modified_since is not None and self.last_modified is not None:
+            since, modified = _http_date(if_modified_since), _http_date(self.last_modified)
+            return since is not None and modified is not None and modified <= since
+        return False
+
+
+class ResponseCache:
+    """组内 GET / HEAD 响应的内存缓存，按字节数做 LRU 淘汰
+
+    缓存键为 方法 + 路径 + 查询参数 + 是否带凭据 + Accept-Encoding 与配置的请求头；上游响应的 Vary 头列出的请求头也需一致才算命中。
+    遵循共享缓存的语义：不缓存 no-store / private / 带 Set-Cookie 的响应和带请求体的请求；
+    带 Authorization / Cookie 的请求只缓存明确 public / s-maxage 的响应，且与不带凭据的请求分开存放。
+    只在代理所在的事件循环中使用，无需加锁。
+    """
+
+    def __init__(self, config: CacheConfig):
+        self.config = config
+        # 压缩与未压缩的响应体不能互相替代，上游未给出 Vary 时也按 Accept-Encoding 区分
+        self.key_headers = tuple(dict.fromkeys(("accept-encoding", *(name.lower() for name in config.key_headers))))
+        self.entries: "OrderedDict[Key, CacheEntry]" = OrderedDict()
+        self.size = 0
+        self.hits = 0  # 直接命中
+        self.revalidations = 0  # 过期后向上游重新验证
+        self.misses = 0
+
+    def lookup(
+            self,
+            method: str,
+            path: str,
+            query: bytes,
+            headers: List[Tuple[str, str]],
+            *extra
+    ) -> Tuple[Optional[Key], Optional[CacheEntry], bool]:
+        """返回 (缓存键, 缓存条目, 能否直接使用)，请求不可缓存时缓存键为 None，未命中时缓存条目为 None
+
+        请求带 Cache-Control: no-cache 或 max-age=0 时，条目只对这次请求视为过期，需要向上游重新验证，
+        不影响其他请求命中同一条目。
+        """
+        if method not in CACHEABLE_METHODS or has_request_body(headers):
+            return None, None, False
+
+        values = {}
+        cache_control = None
+        credentialed = False
+        for name, value in headers:
+            name = name.lower()
+            if name in CREDENTIAL_HEADERS:
+                credentialed = True
+            elif name == "cache-control":
+                cache_control = parse_cache_control(value)
+            values[name] = value
+        if cache_control is not None and "no-store" in cache_control:
+            return None, None, False
+
+        key = (method, path, query, credentialed, *(values.get(name) for name in self.key_headers), *extra)
+        entry = self.entries.get(key)
+        if entry is None or any(values.get(name) != value for name, value in entry.vary):
+            self.misses += 1
+            return key, None, False
+
+        fresh = entry.is_fresh() and not (
+            cache_control is not None and ("no-cache" in cache_control or cache_control.get("max-age") == "0")
+        )
+        if fresh:
+            self.hits += 1
+        else:
+            self.revalidations += 1
+        self.entries.move_to_end(key)
+        return key, entry, fresh
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry, headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """过期条目向上游重新验证时附加的条件请求头，下游自己带了条件请求头时不修改"""
+        if any(key.lower() in ("if-none-match", "if-modified-since") for key, _ in headers):
+            return headers
+        headers = list(headers)
+        if entry.etag is not None:
+            headers.append(("if-none-match", entry.etag))
+        if entry.last_modified is not None:
+            headers.append(("if-modified-since", entry.last_modified))
+        return headers
+
+    def freshness(self, status: int, headers: httpx.Headers, credentialed: bool = False) -> Optional[float]:
+        """响应可缓存时返回缓存时间（秒，0 表示每次都要重新验证），不可缓存时返回 None
+
+        credentialed 表示请求带有 Authorization / Cookie，此时上游没有给出缓存时间也不使用 default_ttl。
+        """
+        if status not in CACHEABLE_STATUS or not is_shareable(headers, credentialed):
+            return None
+
+        cache_control = parse_cache_control(headers.get("cache-control"))
+
+        ttl = _seconds(cache_control.get("s-maxage")) if "s-maxage" in cache_control else None
+        if ttl is None and "max-age" in cache_control:
+            ttl = _seconds(cache_control.get("max-age"))
+        if ttl is None and "expires" in headers:
+            expires = _http_date(headers["expires"])
+            date = _http_date(headers.get("date")) or time.time()
+            ttl = max(expires - date, 0.0) if expires is not None else 0.0
+        if ttl is not None:
+            ttl = max(ttl - (_seconds(headers.get("age")) or 0), 0)
+        elif not credentialed:
+            ttl = self.config.default_ttl
+
+        if "no-cache" in cache_control:
+            ttl = 0.0
+        if ttl is None:
+            ttl = 0.0 if "etag" in headers or "last-modified" in headers else None
+        if ttl == 0.0 and "etag" not in headers and "last-modified" not in headers:
+            return None
+        return ttl
+
+    def store(self, key: Key, request_headers: List[Tuple[str, str]], response: httpx.Response):
+        """响应可缓存时包装响应流，响应体完整转发后写入缓存"""
+        ttl = self.freshness(response.status_code, response.headers, has_credentials(request_headers))
+        if ttl is None:
+            return
+
+        length = response.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.config.max_entry_bytes:
+            return
+
+        values = {name.lower(): value for name, value in request_headers}
+        vary = tuple(
+            (name, values.get(name))
+            for name in (part.strip().lower() for part in response.headers.get("vary", "").split(","))
+            if name
+        )
+        status = response.status_code
+        headers = downstream_response_headers(response.headers.multi_items())
+        head = response.request.method == "HEAD"
+
+        def on_complete(body: bytes):
+            entry_headers = headers
+            if not head:
+                # 分块传输的响应缓存后按完整长度返回
+                entry_headers = [item for item in headers if item[0] != b"content-length"]
+                entry_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            self.put(key, CacheEntry(status, entry_headers, body, vary, ttl))
+
+        response.stream = RecordingStream(response.stream, self.config.max_entry_bytes, on_complete)
+
+    def revalidated(self, key: Key, entry: CacheEntry, response: httpx.Response) -> Optional[CacheEntry]:
+        """上游回复 304 时用新的响应头更新条目，返回可以继续使用的条目"""
+        updated = {key.lower().encode("latin-1") for key in response.headers.keys()}
+        headers = [item for item in entry.headers if item[0] not in updated or item[0] == b"content-length"]
+        headers += [item for item in downstream_response_headers(response.headers.multi_items()) if item[0] != b"content-length"]
+
+        merged = httpx.Headers([(key.decode("latin-1"), value.decode("latin-1")) for key, value in headers])
+        ttl = self.freshness(entry.status, merged, has_credentials(response.request.headers.items()))
+        if ttl is None:
+            self.remove(key)
+            return CacheEntry(entry.status, headers, entry.body, entry.vary, 0.0)
+
+        entry = CacheEntry(entry.status, headers, entry.body, entry.vary, ttl)
+        self.put(key, entry)
+        return entry
+
+    def put(self, key: Key, entry: CacheEntry):
+        if entry.size > self.config.max_bytes:
+            return
+        self.remove(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.config.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def remove(self, key: Key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
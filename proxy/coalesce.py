@@ -0,0 +1,127 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from models.base import CoalesceConfig
+from proxy.cache import CachedResponse, CACHEABLE_METHODS, is_shareable
+from proxy.headers import downstream_response_headers
+from proxy.stream import ClosingStream, RecordingStream, has_request_body
+from proxy.timeouts import DeadlineExceeded, remaining
+
+# 除配置的请求头外，始终参与合并键的请求头：这些头会改变上游返回的内容
+KEY_HEADERS = ("authorization", "cookie", "accept-encoding", "range", "if-none-match", "if-modified-since")
+
+Key = Tuple
+
+
+class Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self):
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+
+
+class Coalescer:
+    """合并同时到达的相同 GET / HEAD 请求（single-flight），带请求体的请求不合并
+
+    第一个请求正常转发并边收边发，之后到达的相同请求等待它的响应完整读完后共享同一份响应体。
+    响应不可共享（带 Set-Cookie、private 等）、响应体超过 max_bytes、第一个请求被下游中断或等待者达到上限时，
+    其余请求各自转发。
+    只在代理所在的事件循环中使用，无需加锁。
+    """
+
+    def __init__(self, config: CoalesceConfig):
+        self.config = config
+        self.key_headers = KEY_HEADERS + tuple(name.lower() for name in config.key_headers if name.lower() not in KEY_HEADERS)
+        self.flights: Dict[Key, Flight] = {}
+        self.coalesced = 0  # 共享到响应的请求数
+
+    def key(self, method: str, path: str, query: bytes, headers: List[Tuple[str, str]], *extra) -> Optional[Key]:
+        """请求不可合并时返回 None：带请求体的 GET（如搜索接口的查询体）响应取决于请求体，不合并"""
+        if method not in CACHEABLE_METHODS or has_request_body(headers):
+            return None
+        values = {}
+        for name, value in headers:
+            name = name.lower()
+            if name in values:
+                values[name] = f"{values[name]}, {value}"
+            else:
+                values[name] = value
+        return (method, path, query, *(values.get(name) for name in self.key_headers), *extra)
+
+    def join(self, key: Key) -> Optional[Flight]:
+        """返回正在进行且还能加入的相同请求"""
+        flight = self.flights.get(key)
+        if flight is None or flight.waiters >= self.config.max_waiters:
+            return None
+        flight.waiters += 1
+        return flight
+
+    async def wait(self, flight: Flight, deadline: Optional[float] = None) -> Optional[CachedResponse]:
+        """等待共享的响应，返回 None 时需要自行转发（下游断开不影响其他等待者）
+
+        deadline 为等待者自己的截止时刻，到时仍未共享到响应时抛出 DeadlineExceeded，第一个请求不受影响。
+        """
+        try:
+            if deadline is None:
+                result = await asyncio.shield(flight.future)
+            else:
+                result = await asyncio.wait_for(asyncio.shield(flight.future), remaining(deadline))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("截止时间前未等到合并请求的响应")
+        finally:
+            flight.waiters -= 1
+        if result is not None:
+            self.coalesced += 1
+        return result
+
+    def lead(self, key: Key) -> Flight:
+        flight = self.flights[key] = Flight()
+        return flight
+
+    def share(self, key: Key, flight: Flight, result: Union[CachedResponse, httpx.Response]):
+        """第一个请求拿到响应后调用，上游响应在完整读完后共享给等待者"""
+        if isinstance(result, CachedResponse):
+            return self._resolve(key, flight, result)
+
+        # 与共享缓存的规则一致：会话、私有或依赖凭据的响应不能给其他请求，等待者各自转发
+        if not is_shareable(result.headers, "authorization" in result.request.headers):
+            return self._resolve(key, flight, None)
+
+        length = result.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.config.max_bytes:
+            return self._resolve(key, flight, None)
+
+        status = result.status_code
+        headers = downstream_response_headers(result.headers.multi_items())
+        head = result.request.method == "HEAD"
+
+        def on_complete(body: bytes):
+            shared_headers = headers
+            if not head:
+                shared_headers = [item for item in headers if item[0] != b"content-length"]
+                shared_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            self._resolve(key, flight, CachedResponse(status, shared_headers, body))
+
+        result.stream = ClosingStream(
+            RecordingStream(result.stream, self.config.max_bytes, on_complete, lambda: self._resolve(key, flight, None)),
+            lambda: self._resolve(key, flight, None)
+        )
+
+    def fail(self, key: Key, flight: Flight, error: BaseException):
+        """第一个请求转发失败：上游错误直接返回给等待者，其他原因（如下游断开）让等待者自行转发"""
+        if isinstance(error, httpx.TransportError) and flight.waiters:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            if not flight.future.done():
+                flight.future.set_exception(error)
+        else:
+            self._resolve(key, flight, None)
+
+    def _resolve(self, key: Key, flight: Flight, result: Optional[CachedResponse]):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.future.done():
+            flight.future.set_result(result)
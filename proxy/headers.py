@@ -0,0 +1,49 @@
+from typing import Iterable, List, Tuple
+
+# RFC 7230 6.1 规定的逐跳头，只对单个连接有效，不能转发
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+})
+
+
+def strip_hop_by_hop(items: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """移除逐跳头以及 Connection 头中列出的头，保留重复头（如 Set-Cookie）"""
+    items = list(items)
+    extra = set()
+    for key, value in items:
+        if key.lower() == "connection":
+            extra.update(token.strip().lower() for token in value.split(",") if token.strip())
+
+    return [
+        (key, value) for key, value in items
+        if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() not in extra
+    ]
+
+
+def upstream_request_headers(items: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """构造转发给上游的请求头
+
+    响应体按原始字节透传，因此客户端未声明 Accept-Encoding 时要显式要求上游不压缩，
+    否则 httpx 会补上默认的 gzip, deflate，导致客户端收到无法解码的内容。
+    """
+    headers = strip_hop_by_hop(items)
+    if not any(key.lower() == "accept-encoding" for key, _ in headers):
+        headers.append(("accept-encoding", "identity"))
+    return headers
+
+
+def downstream_response_headers(items: Iterable[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+    """构造返回给下游的原始响应头（ASGI 格式）"""
+    return [
+        (key.lower().encode("latin-1"), value.encode("latin-1"))
+        for key, value in strip_hop_by_hop(items)
+    ]
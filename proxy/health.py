@@ -0,0 +1,178 @@
+import random
+import asyncio
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+import httpx
+
+from models.base import Group, HealthConfig
+from utils.base import join_url, LOGGER
+
+if TYPE_CHECKING:
+    from proxy.base import ProxyServer
+
+# 检查间隔的随机抖动比例，避免所有组同时发起检查
+JITTER = 0.2
+
+
+class BackendHealth:
+    __slots__ = ("healthy", "successes", "failures")
+
+    def __init__(self):
+        self.healthy = True  # 未检查过的后端视为健康
+        self.successes = 0
+        self.failures = 0
+
+
+class HealthChecker:
+    """后台主动健康检查
+
+    每个配置了 health 的组一个检查任务，按组的间隔（带随机抖动）检查组内所有后端，
+    全局并发数受 concurrency 限制，检查请求复用该组的长连接客户端。
+
+    后端状态变化时：
+    + 通知监听者（health 事件）
+    + 配置了负载均衡的组，把异常后端移出均衡器
+    + 未配置负载均衡的组，当前后端异常时自动切换到第一个健康的后端（backend 事件）
+    """
+
+    def __init__(self, proxy_server: "ProxyServer", concurrency: int = 10):
+        self.proxy_server = proxy_server
+        self.concurrency = concurrency
+        self.states: Dict[Tuple[int, str, str], BackendHealth] = {}  # (端口, 组路径, 后端地址) -> 状态
+        self.tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.sync()
+
+    async def stop(self):
+        self._running = False
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def sync(self):
+        """转发规则变化后调用：为新配置了健康检查的组启动任务，取消已删除组的任务"""
+        if not self._running:
+            return
+
+        wanted = {
+            (port, group.path)
+            for port, groups in self.proxy_server.servers.items()
+            for group in groups
+            if group.health is not None
+        }
+        for key in list(self.tasks):
+            if key not in wanted:
+                self.tasks.pop(key).cancel()
+        for key in wanted:
+            if key not in self.tasks:
+                self.tasks[key] = asyncio.ensure_future(self._run_group(*key))
+
+        # 清理已不存在的后端状态
+        for key in list(self.states):
+            if key[:2] not in wanted:
+                del self.states[key]
+
+    def is_healthy(self, port: int, path: str, url: str) -> bool:
+        state = self.states.get((port, path, url))
+        return state is None or state.healthy
+
+    async def _run_group(self, port: int, path: str):
+        first = True
+        while True:
+            group = self.proxy_server.find_group(port, path)
+            if group is None or group.health is None:
+                self.tasks.pop((port, path), None)
+                return
+
+            interval = group.health.interval
+            # 首次检查在一个间隔内随机开始，之后每次间隔带 ±JITTER 的抖动
+            await asyncio.sleep(random.uniform(0, interval) if first else interval * random.uniform(1 - JITTER, 1 + JITTER))
+            first = False
+
+            group = self.proxy_server.find_group(port, path)
+            if group is None or group.health is None:
+                continue
+            try:
+                await self.check_group(port, group)
+            except Exception as e:
+                LOGGER.error(f"健康检查 {port}{path} 失败: {e}")
+
+    async def check_group(self, port: int, group: Group):
+        results = await asyncio.gather(*(
+            self.probe(port, group, backend.url) for backend in group.backends
+        ))
+
+        changed = False
+        for backend, ok in zip(group.backends, results):
+            if self._record(port, group, backend.url, ok):
+                changed = True
+                self.proxy_server.emit("health", port=port, path=group.path, url=backend.url, healthy=ok)
+                LOGGER.info(f"后端 {backend.url}（{port}{group.path}）{'恢复正常' if ok else '异常'}")
+
+        if changed:
+            self.apply(port, group)
+        self._failover(port, group)
+
+    def _record(self, port: int, group: Group, url: str, ok: bool) -> bool:
+        """记录一次检查结果，返回健康状态是否发生变化"""
+        state = self.states.setdefault((port, group.path, url), BackendHealth())
+        if ok:
+            state.successes += 1
+            state.failures = 0
+            if not state.healthy and state.successes >= group.health.healthy_threshold:
+                state.healthy = True
+                return True
+        else:
+            state.failures += 1
+            state.successes = 0
+            if state.healthy and state.failures >= group.health.unhealthy_threshold:
+                state.healthy = False
+                return True
+        return False
+
+    def apply(self, port: int, group: Group):
+        """把健康状态同步到组的均衡器（均衡器重建后也需要调用）"""
+        balancer = self.proxy_server.balancers.get((port, group.path))
+        if balancer is None:
+            return
+        for idx, backend in enumerate(group.backends):
+            balancer.set_down(idx, not self.is_healthy(port, group.path, backend.url))
+
+    def _failover(self, port: int, group: Group):
+        """未配置负载均衡时，当前后端异常则切换到第一个健康的后端"""
+        if group.balance is not None:
+            return
+        row = group.current_backend
+        if row is None or not 0 <= row < len(group.backends):
+            return
+        if self.is_healthy(port, group.path, group.backends[row].url):
+            return
+
+        for idx, backend in enumerate(group.backends):
+            if idx != row and self.is_healthy(port, group.path, backend.url):
+                self.proxy_server.set_current_backend(port, group, idx)
+                LOGGER.warning(f"{port}{group.path} 当前后端异常，已自动切换到 {backend.url}")
+                return
+
+    async def probe(self, port: Optional[int], group: Optional[Group], url: str) -> bool:
+        """检查单个后端，指定组时复用该组的长连接客户端并使用组的健康检查配置"""
+        health = (group.health if group is not None else None) or HealthConfig()
+        client = self.proxy_server.clients.get(port, group) if group is not None else self.proxy_server.clients.default()
+        target = join_url(url, health.path) if group is not None and group.health is not None else url
+
+        semaphore = self._semaphore or asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            try:
+                response = await client.get(target, timeout=health.timeout)
+            except (httpx.HTTPError, OSError):
+                return False
+        if health.expected_status is None:
+            return True
+        return response.status_code == health.expected_status
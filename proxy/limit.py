@@ -0,0 +1,127 @@
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Deque, List, Optional
+
+from models.base import Group, LimitConfig
+from proxy.timeouts import DeadlineExceeded, remaining
+
+
+class Overloaded(Exception):
+    """超过组的容量，请求被拒绝"""
+
+    def __init__(self, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code  # 429：超过速率；503：并发已满
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """组的准入控制：令牌桶限速、组与后端的并发上限、组并发已满时的有界排队
+
+    只在代理所在的事件循环中使用，无需加锁。
+    """
+
+    def __init__(self, group: Group):
+        self.config: LimitConfig = group.limit
+        self.signature_key = self.signature(group)
+        self.in_flight = 0
+        self.backend_in_flight: List[int] = [0] * len(group.backends or [])
+        self.queue: Deque[asyncio.Future] = deque()
+        self.burst = float(self.config.burst or max(math.ceil(self.config.rate or 1), 1))
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.rejected = 0
+
+    @staticmethod
+    def signature(group: Group) -> tuple:
+        """配置或后端数量变化时才需要重建（重建会清空计数）"""
+        return group.limit, len(group.backends or [])
+
+    async def acquire(self, row: int, deadline: Optional[float] = None):
+        """取得转发许可，超过容量时抛出 Overloaded，成功后必须调用 release
+
+        deadline 为请求的截止时刻，排队最多等到截止时刻，先到截止时刻时抛出 DeadlineExceeded。
+        """
+        config = self.config
+        if config.rate is not None and not self._take_token():
+            self.rejected += 1
+            retry_after = math.ceil((1 - self.tokens) / config.rate)
+            raise Overloaded(429, retry_after, "请求过于频繁")
+
+        self.acquire_backend(row)
+        if config.max_in_flight is not None:
+            try:
+                await self._acquire_slot(deadline)
+            except BaseException:
+                self.release_backend(row)
+                raise
+
+    def release(self, row: int):
+        self.release_backend(row)
+        if self.config.max_in_flight is not None:
+            self._release_slot()
+
+    def acquire_backend(self, row: int):
+        """只占用后端的并发名额（组的名额已由同一请求持有，如重试换到其他后端），成功后必须调用 release_backend"""
+        per_backend = self.config.max_in_flight_per_backend
+        if row >= len(self.backend_in_flight):
+            return
+        if per_backend is not None and self.backend_in_flight[row] >= per_backend:
+            self.rejected += 1
+            raise Overloaded(503, self.config.retry_after, "后端繁忙")
+        self.backend_in_flight[row] += 1
+
+    def release_backend(self, row: int):
+        if row < len(self.backend_in_flight):
+            self.backend_in_flight[row] -= 1
+
+    def _release_slot(self):
+        # 直接把名额交给排队中的请求
+        while self.queue:
+            waiter = self.queue.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.refilled_at) * self.config.rate, self.burst)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def _acquire_slot(self, deadline: Optional[float]):
+        config = self.config
+        if self.in_flight < config.max_in_flight and not self.queue:
+            self.in_flight += 1
+            return
+        if len(self.queue) >= config.queue_size:
+            self.rejected += 1
+            raise Overloaded(503, config.retry_after, "服务繁忙")
+
+        timeout = config.queue_timeout
+        expires = deadline is not None and remaining(deadline) < timeout
+        if expires:
+            timeout = remaining(deadline)
+        waiter = asyncio.get_running_loop().create_future()
+        self.queue.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter in self.queue:
+                self.queue.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # 超时的同时拿到了名额，交给下一个请求
+                self._release_slot()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                if expires:
+                    # 请求的截止时间先到，返回 504 而不是等排队超时后再返回 503
+                    raise DeadlineExceeded("排队等待超过截止时间")
+                raise Overloaded(503, config.retry_after, "服务繁忙，排队超时")
+            raise
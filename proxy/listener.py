@@ -0,0 +1,196 @@
+import socket
+import asyncio
+import contextlib
+import weakref
+from typing import Dict, List, Optional, Set
+
+import uvicorn
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from proxy.asgi import send_json
+from utils.base import LOGGER
+
+
+class Server(uvicorn.Server):
+    """不接管进程信号的 uvicorn 服务器
+
+    管理端口与转发端口的服务器同时运行时，uvicorn 各自安装的信号处理器会互相覆盖，
+    只有最后一个能收到 SIGTERM，因此信号统一交给 ProxyServer 的调用方处理。
+    """
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+def listen_socket(port: int, host: str = "0.0.0.0") -> socket.socket:
+    """绑定监听套接字，端口被占用时抛出 OSError"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class PortListener:
+    """单个端口的监听器，以及从它接入的连接和这些连接上进行中的请求"""
+
+    def __init__(self, port: int, app: ASGIApp):
+        self.port = port
+        self.server: Optional[asyncio.base_events.Server] = None
+        self.starting: Optional[asyncio.Task] = None
+        self.closed = False
+        self.connections: "weakref.WeakSet[asyncio.Protocol]" = weakref.WeakSet()
+        self.requests: Set[asyncio.Task] = set()  # 正在执行应用的请求任务
+        self.cancelled = False  # 排空超时，进行中的请求已被取消
+        self._app = app
+
+    async def app(self, scope: Scope, receive: Receive, send: Send):
+        task = asyncio.current_task()
+        self.requests.add(task)
+        started = False
+
+        async def send_tracked(message: Message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self._app(scope, receive, send_tracked if scope["type"] == "http" else send)
+        except asyncio.CancelledError:
+            if not self.cancelled:
+                raise
+            # 排空超时主动取消的请求：尚未开始响应时返回可重试的 503（任何应用入口都一样），不作为应用异常记录
+            if scope["type"] == "http" and not started:
+                with contextlib.suppress(Exception):
+                    await send_json(send, 503, {"error": '服务正在停止'}, [(b"connection", b"close")])
+        finally:
+            self.requests.discard(task)
+
+
+class Listener(Server):
+    """所有转发端口共用的 uvicorn 服务器
+
+    只有一个应用、一份配置、一个 lifespan 和主循环，每个端口只是一个使用同一协议工厂的监听套接字，
+    应用按连接的本地端口（scope["server"]）分发到对应端口的路由表。增减端口只打开或关闭监听套接字，
+    停止端口时只排空从该端口接入的连接。
+    """
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self.ports: Dict[int, PortListener] = {}
+        self.ready = asyncio.Event()  # lifespan 启动完成，可以开始监听端口
+        self.task: Optional[asyncio.Task] = None
+
+    async def startup(self, sockets: Optional[List[socket.socket]] = None):
+        # 不绑定 config 中的地址，端口由 open 逐个添加
+        await self.lifespan.startup()
+        if self.lifespan.should_exit:
+            self.should_exit = True
+            return
+        self.servers = []
+        self.started = True
+        self.ready.set()
+
+    async def start(self) -> bool:
+        """在后台运行主循环并等待启动完成，启动失败时返回 False"""
+        self.task = asyncio.ensure_future(self.serve())
+        ready = asyncio.ensure_future(self.ready.wait())
+        try:
+            await asyncio.wait((self.task, ready), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready.cancel()
+        return self.started
+
+    async def stop(self):
+        """退出主循环，此前应已关闭并排空所有端口"""
+        self.should_exit = True
+        if self.task is not None:
+            await self.task
+
+    def open(self, port: int, sock: Optional[socket.socket] = None) -> PortListener:
+        """开始监听端口，sock 为预先绑定的套接字；绑定失败时抛出 OSError"""
+        if sock is None:
+            sock = listen_socket(port)
+        listener = PortListener(port, self.config.loaded_app)
+        listener.starting = asyncio.ensure_future(self._serve_port(listener, sock))
+        self.ports[port] = listener
+        return listener
+
+    async def _serve_port(self, listener: PortListener, sock: socket.socket):
+        config = self.config
+
+        def create_protocol(_loop: Optional[asyncio.AbstractEventLoop] = None) -> asyncio.Protocol:
+            protocol = config.http_protocol_class(
+                config=config,
+                server_state=self.server_state,
+                app_state=self.lifespan.state,
+                _loop=_loop,
+            )
+            # 经过端口自己的应用入口，停止端口时只取消该端口上的请求
+            protocol.app = listener.app
+            listener.connections.add(protocol)
+            return protocol
+
+        loop = asyncio.get_running_loop()
+        try:
+            server = await loop.create_server(create_protocol, sock=sock, ssl=config.ssl, backlog=config.backlog)
+        except OSError as e:
+            LOGGER.error(f"端口 {listener.port} 监听失败: {e}")
+            sock.close()
+            if self.ports.get(listener.port) is listener:
+                del self.ports[listener.port]
+            return
+        if listener.closed:
+            server.close()
+            return
+        listener.server = server
+        self.servers.append(server)
+
+    def close(self, port: int) -> Optional[PortListener]:
+        """停止接受新连接，关闭端口上空闲的长连接，进行中的请求完成后连接随之关闭"""
+        listener = self.ports.pop(port, None)
+        if listener is None:
+            return None
+        listener.closed = True
+        if listener.server is not None:
+            listener.server.close()
+            self.servers.remove(listener.server)
+        for connection in self.connections(listener):
+            connection.shutdown()
+        return listener
+
+    def connections(self, listener: PortListener) -> list:
+        """端口上尚未关闭的连接"""
+        return [connection for connection in listener.connections if connection in self.server_state.connections]
+
+    async def drain(self, listener: PortListener, timeout: float) -> int:
+        """等待已关闭端口上的连接全部结束，超过 timeout 秒时取消进行中的请求并断开剩余的连接，返回被断开的连接数"""
+        if listener.starting is not None:
+            await listener.starting
+
+        async def closed():
+            while self.connections(listener):
+                await asyncio.sleep(0.1)
+
+        try:
+            await asyncio.wait_for(closed(), timeout)
+            return 0
+        except asyncio.TimeoutError:
+            pass
+
+        # 与 uvicorn 一致，先取消请求（转发应用此时返回 503），再断开连接
+        listener.cancelled = True
+        requests = list(listener.requests)
+        for task in requests:
+            task.cancel()
+        if requests:
+            await asyncio.wait(requests, timeout=1.0)
+        connections = self.connections(listener)
+        for connection in connections:
+            connection.transport.close()
+        return len(connections)
@@ -0,0 +1,272 @@
+import time
+import bisect
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+import httpx
+from starlette.requests import ClientDisconnect
+
+from proxy.cache import CachedResponse
+from proxy.limit import Overloaded
+
+if TYPE_CHECKING:
+    from proxy.base import ProxyServer
+
+# 延迟直方图的桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+class Histogram:
+    """固定桶直方图，记录时只做一次二分查找和两次加法"""
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class BackendStats:
+    """单个 (端口, 组, 后端) 的指标，只在代理所在的事件循环中修改，无需加锁"""
+    __slots__ = (
+        "labels", "statuses", "errors", "in_flight", "bytes_in", "bytes_out",
+        "connect", "headers", "duration", "connections"
+    )
+
+    def __init__(self, labels: str):
+        self.labels = labels  # 预先格式化好的标签
+        self.statuses = [0] * len(STATUS_CLASSES)
+        self.errors: Dict[str, int] = {}
+        self.in_flight = 0
+        self.bytes_in = 0  # 转发给上游的请求体字节数
+        self.bytes_out = 0  # 返回给下游的响应体字节数
+        self.connect = Histogram()  # 新建上游连接（含 TLS 握手）的耗时
+        self.headers = Histogram()  # 收到响应头的耗时
+        self.duration = Histogram()  # 整个请求的耗时（到响应体转发完毕）
+        self.connections = 0  # 新建的上游连接数
+
+    def started(self, content: Optional[AsyncIterator[bytes]]) -> Optional[AsyncIterator[bytes]]:
+        self.in_flight += 1
+        if content is None:
+            return None
+        return self.count_request(content)
+
+    async def count_request(self, content: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in content:
+            self.bytes_in += len(chunk)
+            yield chunk
+
+    def failed(self, error: BaseException, start: float):
+        if isinstance(error, Overloaded):
+            reason = "overloaded"
+        elif isinstance(error, httpx.TimeoutException):
+            reason = "timeout"
+        elif isinstance(error, (ConnectionError, httpx.ConnectError)):
+            reason = "connect"
+        elif isinstance(error, ClientDisconnect):
+            reason = "client_disconnect"
+        else:
+            reason = "error"
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+        self.in_flight -= 1
+        self.duration.observe(time.perf_counter() - start)
+
+    def responded(self, response: Union[CachedResponse, httpx.Response], start: float):
+        if isinstance(response, CachedResponse):
+            self.finish(response.status, start)
+            self.bytes_out += len(response.body)
+            return
+        self.headers.observe(time.perf_counter() - start)
+        response.stream = MeteredStream(response.stream, self, response.status_code, start)
+
+    def finish(self, status: int, start: float):
+        self.in_flight -= 1
+        self.duration.observe(time.perf_counter() - start)
+        idx = status // 100 - 1
+        if 0 <= idx < len(self.statuses):
+            self.statuses[idx] += 1
+
+    def tracer(self, https: bool) -> Callable:
+        """httpx 的 trace 回调，只在新建连接时记录耗时"""
+        started = None
+
+        async def trace(event: str, info: dict):
+            nonlocal started
+            if event == "connection.connect_tcp.started":
+                started = time.perf_counter()
+            elif started is not None and event == ("connection.start_tls.complete" if https else "connection.connect_tcp.complete"):
+                self.connect.observe(time.perf_counter() - started)
+                self.connections += 1
+                started = None
+
+        return trace
+
+
+class MeteredStream(httpx.AsyncByteStream):
+    """统计转发的响应体字节数，响应关闭时记录请求耗时"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, stats: BackendStats, status: int, start: float):
+        self._stream = stream
+        self._stats = stats
+        self._status = status
+        self._start = start
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        stats = self._stats
+        async for chunk in self._stream:
+            stats.bytes_out += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        stats, self._stats = self._stats, None
+        try:
+            await self._stream.aclose()
+        finally:
+            if stats is not None:
+                stats.finish(self._status, self._start)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class Metrics:
+    """进程内的转发指标，以 Prometheus 文本格式导出
+
+    记录只修改预先创建好的对象上的整数和列表，不加锁、不分配标签字符串；
+    连接池、缓存、限流等已有的统计在导出时才读取。
+    """
+
+    def __init__(self, proxy_server: "ProxyServer"):
+        self.proxy_server = proxy_server
+        self.backends: Dict[Tuple[int, str, str], BackendStats] = {}
+        self.no_backend: Dict[int, int] = {}  # 端口 -> 没有匹配的组或后端而返回 503 的次数
+
+    def backend(self, port: int, path: str, url: str) -> BackendStats:
+        key = (port, path, url)
+        stats = self.backends.get(key)
+        if stats is None:
+            stats = self.backends[key] = BackendStats(_labels(port=port, group=path, backend=url))
+        return stats
+
+    def unmatched(self, port: int):
+        self.no_backend[port] = self.no_backend.get(port, 0) + 1
+
+    def render(self) -> str:
+        lines: List[str] = []
+        backends = list(self.backends.values())
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family("rf_requests_total", "counter", "Forwarded requests by status class")
+        for stats in backends:
+            for status_class, count in zip(STATUS_CLASSES, stats.statuses):
+                if count:
+                    lines.append(f'rf_requests_total{{{stats.labels},code="{status_class}"}} {count}')
+
+        family("rf_request_errors_total", "counter", "Requests that failed before a response was received")
+        for stats in backends:
+            for reason, count in stats.errors.items():
+                lines.append(f'rf_request_errors_total{{{stats.labels},reason="{reason}"}} {count}')
+        for port, count in self.no_backend.items():
+            lines.append(f'rf_request_errors_total{{{_labels(port=port, group="", backend="")},reason="no_backend"}} {count}')
+
+        family("rf_requests_in_flight", "gauge", "Requests currently being forwarded")
+        for stats in backends:
+            lines.append(f"rf_requests_in_flight{{{stats.labels}}} {stats.in_flight}")
+
+        family("rf_request_bytes_total", "counter", "Request body bytes sent upstream")
+        for stats in backends:
+            lines.append(f"rf_request_bytes_total{{{stats.labels}}} {stats.bytes_in}")
+        family("rf_response_bytes_total", "counter", "Response body bytes sent downstream")
+        for stats in backends:
+            lines.append(f"rf_response_bytes_total{{{stats.labels}}} {stats.bytes_out}")
+
+        family("rf_upstream_connections_total", "counter", "New upstream connections")
+        for stats in backends:
+            lines.append(f"rf_upstream_connections_total{{{stats.labels}}} {stats.connections}")
+
+        for name, attr, help_text in (
+                ("rf_upstream_connect_seconds", "connect", "Time to establish a new upstream connection"),
+                ("rf_upstream_headers_seconds", "headers", "Time until upstream response headers (TTFB)"),
+                ("rf_request_duration_seconds", "duration", "Total request time until the response body is sent"),
+        ):
+            family(name, "histogram", help_text)
+            for stats in backends:
+                self._histogram(lines, name, stats.labels, getattr(stats, attr))
+
+        self._pool(lines, family)
+        self._components(lines, family)
+        lines.append("")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _histogram(lines: List[str], name: str, labels: str, histogram: Histogram):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+    def _pool(self, lines: List[str], family: Callable):
+        family("rf_pool_connections", "gauge", "Upstream connections held by each group's client pool")
+        for (port, path), (active, idle) in self.proxy_server.clients.stats().items():
+            labels = _labels(port=port, group=path)
+            lines.append(f'rf_pool_connections{{{labels},state="active"}} {active}')
+            lines.append(f'rf_pool_connections{{{labels},state="idle"}} {idle}')
+
+    def _components(self, lines: List[str], family: Callable):
+        server = self.proxy_server
+
+        family("rf_cache_requests_total", "counter", "Response cache lookups by result")
+        for (port, path), cache in server.caches.items():
+            labels = _labels(port=port, group=path)
+            for result, count in (("hit", cache.hits), ("revalidate", cache.revalidations), ("miss", cache.misses)):
+                lines.append(f'rf_cache_requests_total{{{labels},result="{result}"}} {count}')
+        family("rf_cache_bytes", "gauge", "Bytes held by the response cache")
+        for (port, path), cache in server.caches.items():
+            lines.append(f"rf_cache_bytes{{{_labels(port=port, group=path)}}} {cache.size}")
+
+        family("rf_coalesced_requests_total", "counter", "Requests answered by sharing an identical in-flight request")
+        for (port, path), coalescer in server.coalescers.items():
+            lines.append(f"rf_coalesced_requests_total{{{_labels(port=port, group=path)}}} {coalescer.coalesced}")
+
+        family("rf_retries_total", "counter", "Retried and hedged upstream requests")
+        for (port, path), policy in server.retries.items():
+            labels = _labels(port=port, group=path)
+            lines.append(f'rf_retries_total{{{labels},kind="retry"}} {policy.retried}')
+            lines.append(f'rf_retries_total{{{labels},kind="hedge"}} {policy.hedged}')
+            lines.append(f'rf_retries_total{{{labels},kind="hedge_win"}} {policy.hedge_wins}')
+
+        family("rf_limit_rejected_total", "counter", "Requests rejected by admission control")
+        for (port, path), limiter in server.limiters.items():
+            lines.append(f"rf_limit_rejected_total{{{_labels(port=port, group=path)}}} {limiter.rejected}")
+        family("rf_limit_queued", "gauge", "Requests waiting for a concurrency slot")
+        for (port, path), limiter in server.limiters.items():
+            lines.append(f"rf_limit_queued{{{_labels(port=port, group=path)}}} {len(limiter.queue)}")
+
+        family("rf_draining_connections", "gauge", "Open downstream connections on ports that are draining")
+        for port, listener in server.draining.values():
+            lines.append(f"rf_draining_connections{{{_labels(port=port)}}} {len(server.listener.connections(listener))}")
+
+        family("rf_backend_up", "gauge", "Backend state from health checks and outlier detection (1 = usable)")
+        for port, table in server.routes.items():
+            for route in table.routes:
+                if route.group.health is None and route.outlier is None:
+                    continue
+                for idx, url in enumerate(route.urls):
+                    up = server.health.is_healthy(port, route.path, url) and not server.outliers.is_ejected(route, idx)
+                    lines.append(f"rf_backend_up{{{_labels(port=port, group=route.path, backend=url)}}} {int(up)}")
@@ -0,0 +1,223 @@
+import time
+import asyncio
+import statistics
+from collections import deque
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+from models.base import Group
+from utils.base import LOGGER
+
+if TYPE_CHECKING:
+    from proxy.base import ProxyServer
+    from proxy.router import Route
+
+# 延迟 EWMA 的平滑系数
+EWMA_ALPHA = 0.3
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Breaker:
+    """单个后端的熔断状态
+
+    + closed：正常转发，统计连续失败、5xx 比例和延迟
+    + open：摘除中，请求直接快速失败
+    + half_open：摘除到期，只放行一个试探请求，成功则恢复，失败则以翻倍的时长再次摘除
+    """
+    __slots__ = ("state", "failures", "results", "ewma", "samples", "ejections", "open_until", "trial", "timer")
+
+    def __init__(self, window: int):
+        self.state = CLOSED
+        self.failures = 0  # 连续失败次数
+        self.results = deque(maxlen=window)  # 最近的请求是否为 5xx
+        self.ewma = 0.0  # 响应头延迟的 EWMA（秒）
+        self.samples = 0
+        self.ejections = 0  # 连续摘除次数，决定下次摘除时长
+        self.open_until = 0.0
+        self.trial = False  # 半开状态下是否已放行试探请求
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def reset(self):
+        self.failures = 0
+        self.results.clear()
+        self.ewma = 0.0
+        self.samples = 0
+
+
+class OutlierDetector:
+    """被动异常检测
+
+    根据真实请求的结果（连接错误 / 超时、5xx 比例、延迟明显高于组内其他后端）摘除后端，
+    摘除期间请求不再发往该后端：配置了负载均衡的组从均衡器中移出，否则直接返回 503，
+    避免请求堆积在已经卡住的后端上。
+
+    熔断状态按 (端口, 组路径, 后端地址) 记录，转发过程中的调用只读取路由快照（Route）中编译好的配置与地址。
+    """
+
+    def __init__(self, proxy_server: "ProxyServer"):
+        self.proxy_server = proxy_server
+        self.breakers: Dict[Tuple[int, str, str], Breaker] = {}  # (端口, 组路径, 后端地址) -> 熔断状态
+
+    def _breaker(self, route: "Route", row: int) -> Breaker:
+        key = (route.port, route.path, route.urls[row])
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = Breaker(route.outlier.window)
+        return breaker
+
+    def allow(self, route: "Route", row: int) -> bool:
+        """本次请求能否发往该后端，半开状态下只放行第一个请求"""
+        if route.outlier is None:
+            return True
+        breaker = self._breaker(route, row)
+        if breaker.state == CLOSED:
+            return True
+        if breaker.state == OPEN:
+            if time.monotonic() < breaker.open_until:
+                return False
+            breaker.state = HALF_OPEN
+            breaker.trial = False
+        if breaker.trial:
+            return False
+        # 试探请求结束前，均衡器不再把其他请求分给该后端
+        breaker.trial = True
+        self._set_ejected(route.port, route.path, row, True)
+        return True
+
+    def is_ejected(self, route: "Route", row: int) -> bool:
+        """后端是否处于摘除或半开状态（不会改变状态）"""
+        if route.outlier is None:
+            return False
+        breaker = self.breakers.get((route.port, route.path, route.urls[row]))
+        return breaker is not None and breaker.state != CLOSED
+
+    def record(self, route: "Route", row: int, ok: bool, latency: Optional[float] = None):
+        """记录请求结果，ok 为 False 表示连接错误、超时或 5xx"""
+        config = route.outlier
+        if config is None:
+            return
+        breaker = self._breaker(route, row)
+
+        if breaker.state == HALF_OPEN and breaker.trial:
+            if ok:
+                self._close(route, row, breaker)
+            else:
+                self._eject(route, row, breaker, "试探请求失败")
+            return
+        if breaker.state != CLOSED:
+            # 摘除前已经发出的请求，结果不再计入
+            return
+
+        breaker.results.append(not ok)
+        if ok:
+            breaker.failures = 0
+            if latency is not None:
+                breaker.samples += 1
+                breaker.ewma = latency if breaker.samples == 1 else breaker.ewma + EWMA_ALPHA * (latency - breaker.ewma)
+        else:
+            breaker.failures += 1
+
+        if breaker.failures >= config.consecutive_errors:
+            self._eject(route, row, breaker, f"连续失败 {breaker.failures} 次")
+        elif (
+                config.error_rate is not None
+                and len(breaker.results) == config.window
+                and sum(breaker.results) / config.window >= config.error_rate
+        ):
+            self._eject(route, row, breaker, f"最近 {config.window} 个请求错误率 {sum(breaker.results) / config.window:.0%}")
+        elif config.latency_factor is not None and breaker.samples >= config.window:
+            median = self._peer_latency(route, row)
+            if median and breaker.ewma > config.latency_factor * median:
+                self._eject(route, row, breaker, f"延迟 {breaker.ewma * 1000:.0f}ms 超过其他后端中位数 {median * 1000:.0f}ms 的 {config.latency_factor} 倍")
+
+    def abort(self, route: "Route", row: int):
+        """请求因下游原因中断（如客户端断开），不计入结果，半开状态下允许重新试探"""
+        if route.outlier is None:
+            return
+        breaker = self._breaker(route, row)
+        if breaker.state == HALF_OPEN and breaker.trial:
+            breaker.trial = False
+            self._set_ejected(route.port, route.path, row, False)
+
+    def _peer_latency(self, route: "Route", row: int) -> Optional[float]:
+        latencies = []
+        for idx, url in enumerate(route.urls):
+            breaker = self.breakers.get((route.port, route.path, url))
+            if idx != row and breaker is not None and breaker.state == CLOSED and breaker.samples >= route.outlier.window:
+                latencies.append(breaker.ewma)
+        return statistics.median(latencies) if latencies else None
+
+    def _eject(self, route: "Route", row: int, breaker: Breaker, reason: str):
+        config = route.outlier
+        duration = min(config.ejection_time * 2 ** breaker.ejections, config.max_ejection_time)
+        breaker.ejections += 1
+        breaker.state = OPEN
+        breaker.trial = False
+        breaker.open_until = time.monotonic() + duration
+        breaker.reset()
+        self._set_ejected(route.port, route.path, row, True)
+
+        # 到期后重新放入均衡器，由下一个选中它的请求试探
+        url = route.urls[row]
+        if breaker.timer is not None:
+            breaker.timer.cancel()
+        breaker.timer = asyncio.get_running_loop().call_later(duration, self._half_open, route.port, route.path, url)
+
+        LOGGER.warning(f"后端 {url}（{route.port}{route.path}）{reason}，摘除 {duration:g} 秒")
+        self.proxy_server.emit("outlier", port=route.port, path=route.path, url=url, ejected=True, duration=duration)
+
+    def _half_open(self, port: int, path: str, url: str):
+        breaker = self.breakers.get((port, path, url))
+        group = self.proxy_server.find_group(port, path)
+        if breaker is None or group is None or breaker.state != OPEN:
+            return
+        breaker.timer = None
+        breaker.state = HALF_OPEN
+        breaker.trial = False
+        for idx, backend in enumerate(group.backends):
+            if backend.url == url:
+                self._set_ejected(port, path, idx, False)
+
+    def _close(self, route: "Route", row: int, breaker: Breaker):
+        breaker.state = CLOSED
+        breaker.trial = False
+        breaker.ejections = 0
+        breaker.reset()
+        self._set_ejected(route.port, route.path, row, False)
+
+        url = route.urls[row]
+        LOGGER.info(f"后端 {url}（{route.port}{route.path}）试探成功，恢复转发")
+        self.proxy_server.emit("outlier", port=route.port, path=route.path, url=url, ejected=False)
+
+    def _set_ejected(self, port: int, path: str, row: int, ejected: bool):
+        # 按 (端口, 路径) 取当前的均衡器，快照引用的均衡器可能已在重建时被替换
+        balancer = self.proxy_server.balancers.get((port, path))
+        if balancer is not None:
+            balancer.set_ejected(row, ejected)
+
+    def apply(self, port: int, group: Group):
+        """把熔断状态同步到组的均衡器（均衡器重建后也需要调用）"""
+        balancer = self.proxy_server.balancers.get((port, group.path))
+        if balancer is None or group.outlier is None:
+            return
+        for idx, backend in enumerate(group.backends):
+            breaker = self.breakers.get((port, group.path, backend.url))
+            ejected = breaker is not None and (breaker.state == OPEN or breaker.trial)
+            balancer.set_ejected(idx, ejected)
+
+    def sync(self):
+        """转发规则变化后调用：清理已删除或不再配置异常检测的组的状态"""
+        wanted = {
+            (port, group.path, backend.url)
+            for port, groups in self.proxy_server.servers.items()
+            for group in groups
+            if group.outlier is not None
+            for backend in group.backends or []
+        }
+        for key in list(self.breakers):
+            if key not in wanted:
+                breaker = self.breakers.pop(key)
+                if breaker.timer is not None:
+                    breaker.timer.cancel()
@@ -0,0 +1,108 @@
+import ssl
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from models.base import Group, PoolConfig
+from proxy.timeouts import build_timeout
+
+# 检查被替换的客户端是否已空闲的间隔（秒）
+RETIRE_CHECK_INTERVAL = 1.0
+
+
+def build_limits(pool: Optional[PoolConfig]) -> httpx.Limits:
+    pool = pool or PoolConfig()
+    return httpx.Limits(
+        max_connections=pool.max_connections,
+        max_keepalive_connections=pool.max_keepalive_connections,
+        keepalive_expiry=pool.keepalive_expiry
+    )
+
+
+class ClientPool:
+    """按 (端口, 组路径) 维护长连接的 httpx.AsyncClient，复用 TCP/TLS 连接，客户端使用组的超时配置"""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[int, str], Tuple[httpx.AsyncClient, tuple]] = {}
+        self._retired: Dict[Tuple[int, str], List[httpx.AsyncClient]] = {}
+        # 所有客户端共用一个 SSL 上下文，加载 CA 证书每次要几十毫秒，端口和组很多时启动会明显变慢
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def get(self, port: int, group: Group) -> httpx.AsyncClient:
+        """获取组对应的客户端，不存在或连接池、超时配置变化时重新创建"""
+        key = (port, group.path)
+        pool = group.pool or PoolConfig()
+        config = (pool, group.timeout)
+        entry = self._clients.get(key)
+        if entry is not None:
+            client, _config = entry
+            if _config == config:
+                return client
+            # 配置变化，旧客户端上可能还有请求在进行，等连接都空闲后再释放
+            self._retire(key, client)
+
+        if self._ssl_context is None:
+            self._ssl_context = httpx.create_ssl_context()
+        client = httpx.AsyncClient(
+            limits=build_limits(pool), timeout=build_timeout(group.timeout), verify=self._ssl_context
+        )
+        self._clients[key] = (client, config)
+        return client
+
+    def default(self) -> httpx.AsyncClient:
+        """不属于任何组的请求（如界面中测试尚未保存的后端）使用的共享客户端"""
+        return self.get(0, Group(path=""))
+
+    @staticmethod
+    def _pool(client: httpx.AsyncClient):
+        # httpx 没有公开连接池的状态，读取底层 httpcore 连接池，读取不到时返回 None
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        return pool if hasattr(pool, "connections") else None
+
+    def stats(self) -> Dict[Tuple[int, str], Tuple[int, int]]:
+        """每个组的客户端当前持有的 (使用中, 空闲) 连接数"""
+        result = {}
+        for key, (client, _) in self._clients.items():
+            pool = self._pool(client)
+            connections = pool.connections if pool is not None else []
+            idle = sum(1 for connection in connections if connection.is_idle())
+            result[key] = (len(connections) - idle, idle)
+        return result
+
+    def retire(self, port: int, path: str):
+        """组被删除后调用，进行中的请求结束后释放它的客户端"""
+        entry = self._clients.pop((port, path), None)
+        if entry is not None:
+            self._retire((port, path), entry[0])
+
+    def _retire(self, key: Tuple[int, str], client: httpx.AsyncClient):
+        self._retired.setdefault(key, []).append(client)
+        try:
+            asyncio.get_running_loop().create_task(self._close_when_idle(key, client))
+        except RuntimeError:
+            # 不在事件循环中（如启动前），等端口关闭时再一起释放
+            pass
+
+    async def _close_when_idle(self, key: Tuple[int, str], client: httpx.AsyncClient):
+        pool = self._pool(client)
+        if pool is None:
+            # 无法判断是否还有请求在进行，等端口关闭时再释放
+            return
+        # 没有等待连接的请求且所有连接都空闲时，说明请求都已结束
+        while getattr(pool, "_requests", None) or not all(connection.is_idle() for connection in pool.connections):
+            await asyncio.sleep(RETIRE_CHECK_INTERVAL)
+        retired = self._retired.get(key, [])
+        if client in retired:
+            retired.remove(client)
+            if not retired:
+                del self._retired[key]
+        await client.aclose()
+
+    async def close(self, port: Optional[int] = None):
+        """关闭指定端口（或全部）的客户端"""
+        keys = [key for key in self._clients if port is None or key[0] == port]
+        clients = [self._clients.pop(key)[0] for key in keys]
+        for key in [key for key in self._retired if port is None or key[0] == port]:
+            clients.extend(self._retired.pop(key))
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
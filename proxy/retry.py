@@ -0,0 +1,56 @@
+from collections import deque
+from typing import Optional
+
+from models.base import RetryConfig
+
+# 可以安全重试的方法（不带请求体时）
+RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# 可以发出对冲请求的方法
+HEDGE_METHODS = frozenset({"GET", "HEAD"})
+# 计算对冲等待时间使用的最近响应数
+LATENCY_WINDOW = 200
+# 至少有这么多样本才开始对冲，每新增这么多样本重新计算一次百分位
+LATENCY_MIN_SAMPLES = 20
+
+
+class RetryPolicy:
+    """组的重试与对冲策略
+
+    重试预算：每个正常请求存入 budget_ratio 个令牌（最多 budget_burst 个），每次重试或对冲取出一个，
+    令牌不足时不再重试，避免后端故障时重试把流量放大数倍。
+    只在代理所在的事件循环中使用，无需加锁。
+    """
+
+    def __init__(self, config: RetryConfig):
+        self.config = config
+        self.tokens = float(config.budget_burst)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # 最近的响应头延迟（秒）
+        self._delay: Optional[float] = None
+        self._pending = 0  # 上次计算百分位后新增的样本数
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0  # 对冲请求先于原请求响应的次数
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.config.budget_ratio, float(self.config.budget_burst))
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+        self._pending += 1
+        if self.config.hedge_percentile is not None and len(self.latencies) >= LATENCY_MIN_SAMPLES and self._pending >= LATENCY_MIN_SAMPLES:
+            self._pending = 0
+            ordered = sorted(self.latencies)
+            idx = min(int(len(ordered) * self.config.hedge_percentile / 100), len(ordered) - 1)
+            self._delay = max(ordered[idx], self.config.hedge_min_delay)
+
+    def hedge_delay(self) -> Optional[float]:
+        """发出对冲请求前等待的时间，未配置或样本不足时返回 None"""
+        if self.config.hedge_percentile is None:
+            return None
+        return self._delay
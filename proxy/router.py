@@ -0,0 +1,144 @@
+from typing import Dict, Iterable, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from models.base import Group, OutlierConfig
+
+if TYPE_CHECKING:
+    from proxy.balancer import Balancer
+    from proxy.cache import ResponseCache
+    from proxy.coalesce import Coalescer
+    from proxy.limit import Limiter
+    from proxy.retry import RetryPolicy
+    from proxy.trace import TraceLog
+
+
+def _origin(url: str) -> Optional[str]:
+    """后端地址的 scheme://host:port，无法解析时返回 None（拼接地址时回退到 urljoin）"""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    if not parts.scheme or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Route:
+    """组的运行时快照，由 ProxyServer.rebuild_routes 根据 Group 编译
+
+    转发过程只读取快照，不再访问可变的 pydantic 模型：后端地址、当前后端、组路径前缀长度等
+    在编译时取出，组的均衡器、缓存、限流等状态对象直接引用，无需每个请求按 (端口, 路径) 查找。
+    构建后不再修改，组变化（包括切换当前后端）时重新编译并整体替换路由表。
+    """
+
+    __slots__ = (
+        "port", "path", "group", "prefix", "urls", "origins", "weights", "current_backend", "balanced", "outlier",
+        "timeout", "client", "balancer", "cache", "coalescer", "retry", "limiter", "trace"
+    )
+
+    def __init__(
+            self,
+            port: int,
+            group: Group,
+            client: httpx.AsyncClient,
+            balancer: Optional["Balancer"] = None,
+            cache: Optional["ResponseCache"] = None,
+            coalescer: Optional["Coalescer"] = None,
+            retry: Optional["RetryPolicy"] = None,
+            limiter: Optional["Limiter"] = None,
+            trace: Optional["TraceLog"] = None
+    ):
+        self.port = port
+        self.path = group.path
+        self.group = group  # 编译所用的模型，转发过程不读取，只用于判断快照能否沿用和管理端展示
+        self.prefix = len(group.path)
+        backends = group.backends or ()
+        self.urls: Tuple[str, ...] = tuple(backend.url for backend in backends)
+        self.origins: Tuple[Optional[str], ...] = tuple(_origin(url) for url in self.urls)
+        self.weights: Tuple[int, ...] = tuple(backend.weight for backend in backends)
+        try:
+            self.current_backend: Optional[int] = int(group.current_backend)
+        except (TypeError, ValueError):
+            self.current_backend = None
+        self.balanced = group.balance is not None
+        self.outlier: Optional[OutlierConfig] = group.outlier  # 异常检测配置，为空时不检测
+        self.timeout = group.timeout
+        self.client = client
+        self.balancer = balancer
+        self.cache = cache
+        self.coalescer = coalescer
+        self.retry = retry
+        self.limiter = limiter
+        self.trace = trace
+
+    def same(self, other: "Route") -> bool:
+        """是否由同一个组对象编译、引用相同的状态对象，是则沿用旧的快照"""
+        return all(getattr(self, name) is getattr(other, name) for name in (
+            "group", "client", "balancer", "cache", "coalescer", "retry", "limiter", "trace"
+        ))
+
+    def backend(self, row: int) -> Optional[str]:
+        if 0 <= row < len(self.urls):
+            return self.urls[row]
+        return None
+
+    def target_url(self, row: int, path: str) -> str:
+        """拼接后端地址与去掉组前缀后的请求路径
+
+        结果与 urljoin(后端地址, 路径) 一致：以 / 开头的普通路径直接拼在 scheme://host:port 后，
+        含 . 段、查询或片段等需要规范化的路径仍交给 urljoin。
+        """
+        if not path:
+            return self.urls[row]
+        origin = self.origins[row]
+        if (origin is not None and path[0] == "/" and not path.startswith("//")
+                and "/." not in path and "?" not in path and "#" not in path):
+            return origin + path
+        return urljoin(self.urls[row], path)
+
+
+class _Node:
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.route: Optional[Route] = None
+
+
+class RouteTable:
+    """单个端口的路由表，按字符前缀树组织，匹配最长的组路径前缀
+
+    构建后不再修改，路由变化时整体重建并替换引用。
+    """
+
+    __slots__ = ("_root", "routes")
+
+    def __init__(self, routes: Iterable[Route]):
+        self._root = _Node()
+        self.routes: Tuple[Route, ...] = tuple(routes)
+        for route in self.routes:
+            node = self._root
+            for char in route.path:
+                node = node.children.setdefault(char, _Node())
+            # 相同路径保留先配置的组，与原先按顺序匹配的行为一致
+            if node.route is None:
+                node.route = route
+
+    def serves(self, routes: Iterable[Route]) -> bool:
+        """是否由同一组快照（按顺序）构建，是则无需重建"""
+        routes = tuple(routes)
+        return len(routes) == len(self.routes) and all(a is b for a, b in zip(routes, self.routes))
+
+    def match(self, path: str) -> Optional[Route]:
+        """返回与 path 匹配的最长前缀组，复杂度 O(len(path))"""
+        node = self._root
+        matched = node.route
+        for char in path:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.route is not None:
+                matched = node.route
+        return matched
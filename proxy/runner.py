@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Callable, Coroutine, Optional
+
+from proxy.base import ProxyServer
+from utils.base import LOGGER
+
+
+class ProxyThread:
+    """在独立线程的事件循环中运行 ProxyServer
+
+    界面线程的重绘、定时器和模态对话框不会再阻塞转发。界面通过 call / submit 把命令投递到代理线程执行，
+    代理线程通过 ProxyServer.add_listener 注册的回调推送事件（回调在代理线程中调用，需自行切回界面线程）。
+    """
+
+    def __init__(self, proxy_server: ProxyServer):
+        self.proxy_server = proxy_server
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ProxyThread", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._stopping = asyncio.Event()
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            LOGGER.error(f"代理服务异常退出: {e}")
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        # 没有配置端口时 start_servers 会立即返回，事件循环仍需保持运行以接收后续命令
+        servers = asyncio.ensure_future(self.proxy_server.start_servers())
+        # 让 start_servers 先启动已配置的端口，之后才开始接收命令，避免同一端口被启动两次
+        await asyncio.sleep(0)
+        self._ready.set()
+
+        await self._stopping.wait()
+        self.proxy_server.shutdown()
+        await servers
+
+        # 等待运行中新增的端口退出
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*others, return_exceptions=True)
+
+    def call(self, func: Callable[..., Any], *args) -> concurrent.futures.Future:
+        """在代理线程中执行同步函数（如修改转发规则），返回线程安全的 Future"""
+        future = concurrent.futures.Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(run)
+        return future
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """在代理线程中执行协程，可在界面事件循环中通过 asyncio.wrap_future 等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout: float = 5.0):
+        """通知所有服务器退出并等待代理线程结束"""
+        if self.loop is None or not self._thread.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
@@ -0,0 +1,118 @@
+from typing import AsyncIterator, Callable, Iterable, Optional, Tuple
+
+import httpx
+from starlette.requests import ClientDisconnect, Request
+from starlette.types import Receive
+
+
+def has_request_body(headers: Iterable[Tuple[str, str]]) -> bool:
+    """根据 Content-Length / Transfer-Encoding 判断请求是否携带请求体"""
+    for key, value in headers:
+        key = key.lower()
+        if key == "transfer-encoding":
+            return True
+        if key == "content-length":
+            return value not in ("", "0")
+    return False
+
+
+async def iter_request_body(request: Request) -> AsyncIterator[bytes]:
+    """逐块读取下游请求体并转发，同一时刻只持有一个 ASGI 消息的数据"""
+    async for chunk in request.stream():
+        if chunk:
+            yield chunk
+
+
+def request_content(request: Request) -> Optional[AsyncIterator[bytes]]:
+    """构造上游请求体：有请求体时流式转发，没有时不发送（避免 GET 被加上 chunked 编码）"""
+    if has_request_body(request.headers.items()):
+        return iter_request_body(request)
+    return None
+
+
+class ReceiveStream:
+    """直接从 ASGI receive 逐块读取请求体，供纯 ASGI 转发使用"""
+
+    __slots__ = ("_receive", "complete")
+
+    def __init__(self, receive: Receive):
+        self._receive = receive
+        self.complete = False  # 请求体是否已读完
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while not self.complete:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnect()
+            self.complete = not message.get("more_body", False)
+            body = message.get("body", b"")
+            if body:
+                yield body
+
+
+async def iter_response_body(response: httpx.Response) -> AsyncIterator[bytes]:
+    """边收边发上游响应体，下游发送完毕或断开后关闭上游响应
+
+    每块数据都要等下游 send 完成才继续读取上游，慢客户端会自然地对上游形成背压。
+    读取的是原始字节，gzip/br 等压缩内容不解压直接透传，与 Content-Encoding 保持一致。
+    """
+    try:
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+class ClosingStream(httpx.AsyncByteStream):
+    """包装上游响应流，响应关闭时（读完、下游断开或出错）回调一次 on_close"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        on_close, self._on_close = self._on_close, None
+        try:
+            await self._stream.aclose()
+        finally:
+            if on_close is not None:
+                on_close()
+
+
+class RecordingStream(httpx.AsyncByteStream):
+    """包装上游响应流，完整读完且不超过 limit 字节时回调 on_complete(响应体)，超过后回调 on_overflow 并不再保存数据"""
+
+    def __init__(
+            self,
+            stream: httpx.AsyncByteStream,
+            limit: int,
+            on_complete: Callable[[bytes], None],
+            on_overflow: Optional[Callable[[], None]] = None
+    ):
+        self._stream = stream
+        self._limit = limit
+        self._on_complete = on_complete
+        self._on_overflow = on_overflow
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        chunks = []
+        size = 0
+        async for chunk in self._stream:
+            if chunks is not None:
+                size += len(chunk)
+                if size > self._limit:
+                    chunks = None
+                    if self._on_overflow is not None:
+                        self._on_overflow()
+                else:
+                    chunks.append(chunk)
+            yield chunk
+        if chunks is not None:
+            self._on_complete(b"".join(chunks))
+
+    async def aclose(self):
+        await self._stream.aclose()
@@ -0,0 +1,71 @@
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import httpx
+
+from models.base import TimeoutConfig
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """超过组配置（或下游传入）的整体截止时间仍未收到上游响应头"""
+
+
+def build_timeout(config: Optional[TimeoutConfig]) -> httpx.Timeout:
+    config = config or TimeoutConfig()
+    return httpx.Timeout(
+        connect=config.connect,
+        read=config.read,
+        write=config.write,
+        pool=config.pool
+    )
+
+
+def request_deadline(
+        config: Optional[TimeoutConfig],
+        headers: Iterable[Tuple[str, str]],
+        now: Optional[float] = None
+) -> Optional[float]:
+    """本次请求的截止时刻（time.monotonic()），都没有配置时返回 None
+
+    组配置的整体超时与下游传入的剩余时间都从请求到达（now）开始计算，取较早的一个；
+    之后的排队、重试和对冲都在这个截止时刻之前完成。
+    """
+    config = config or TimeoutConfig()
+    budget = config.deadline
+    if config.deadline_header:
+        name = config.deadline_header.lower()
+        for key, value in headers:
+            if key.lower() == name:
+                try:
+                    incoming = int(value) / 1000
+                except ValueError:
+                    break
+                if incoming >= 0 and (budget is None or incoming < budget):
+                    budget = incoming
+                break
+    if budget is None:
+        return None
+    return (time.monotonic() if now is None else now) + budget
+
+
+def remaining(deadline: float) -> float:
+    """距截止时刻的剩余时间（秒），已经过了截止时刻时为 0"""
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def with_deadline_header(
+        config: Optional[TimeoutConfig],
+        headers: List[Tuple[str, str]],
+        remaining: float
+) -> List[Tuple[str, str]]:
+    """把剩余时间（毫秒）写入请求头传给上游，上游可据此放弃注定超时的请求
+
+    传入的是当前剩余的时间，而不是最初的预算，经过多跳转发时每一跳看到的都是真实的剩余时间。
+    """
+    config = config or TimeoutConfig()
+    if not config.deadline_header:
+        return headers
+    name = config.deadline_header.lower()
+    headers = [(key, value) for key, value in headers if key.lower() != name]
+    headers.append((config.deadline_header, str(max(int(remaining * 1000), 0))))
+    return headers
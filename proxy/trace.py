@@ -0,0 +1,120 @@
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Optional, Union
+
+import httpx
+
+from models.base import TraceConfig
+from proxy.cache import CachedResponse
+from proxy.stream import ClosingStream
+
+# 当前请求的计时，由 ProxyServer.fetch 设置，转发过程中的各层按需记录阶段耗时
+CURRENT: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+def note(name: str, value: str):
+    """给当前请求记录一个说明（如缓存命中），未开启计时时忽略"""
+    trace = CURRENT.get()
+    if trace is not None:
+        trace.notes[name] = value
+
+
+class RequestTrace:
+    """单个请求各阶段的耗时（秒）
+
+    + match：路由匹配与选择后端
+    + queue：准入控制排队
+    + conn：取得上游连接（等待连接池、建立连接、TLS 握手）
+    + upstream：请求头发出到收到响应头（上游处理时间）
+    + body：收到响应头到响应体转发完毕
+    重试与对冲的多次尝试累加到同一阶段。
+    """
+    __slots__ = ("log", "method", "path", "start", "phases", "notes", "backend", "status", "headers_at")
+
+    def __init__(self, log: "TraceLog", method: str, path: str, start: float):
+        self.log = log
+        self.method = method
+        self.path = path
+        self.start = start
+        self.phases: Dict[str, float] = {}
+        self.notes: Dict[str, str] = {}
+        self.backend: Optional[str] = None
+        self.status: Optional[int] = None
+        self.headers_at: Optional[float] = None  # 收到响应头的时间
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def tracer(self, inner: Optional[Callable] = None) -> Callable:
+        """httpx 的 trace 回调，在发出请求前创建，inner 为同时需要调用的其他回调（如指标）"""
+        sent = time.perf_counter()
+
+        async def trace(event: str, info: dict):
+            nonlocal sent
+            if inner is not None:
+                await inner(event, info)
+            if event.endswith("send_request_headers.started"):
+                now = time.perf_counter()
+                self.add("conn", now - sent)
+                sent = now
+            elif event.endswith("receive_response_headers.complete"):
+                self.add("upstream", time.perf_counter() - sent)
+
+        return trace
+
+    def responded(self, response: Union[CachedResponse, httpx.Response]):
+        self.headers_at = time.perf_counter()
+        if isinstance(response, CachedResponse):
+            self.status = response.status
+            self.finish()
+            return
+        self.status = response.status_code
+        response.stream = ClosingStream(response.stream, self.finish)
+
+    def finish(self, error: Optional[BaseException] = None):
+        end = time.perf_counter()
+        if self.headers_at is not None:
+            self.phases["body"] = end - self.headers_at
+        self.log.record(self, end - self.start, error)
+
+    def server_timing(self) -> bytes:
+        """响应头发出前的各阶段耗时（毫秒），响应体的耗时只能记录在慢请求中"""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items() if name != "body"]
+        if self.headers_at is not None:
+            parts.append(f"total;dur={(self.headers_at - self.start) * 1000:.2f}")
+        parts.extend(f'{name};desc="{value}"' for name, value in self.notes.items())
+        return ", ".join(parts).encode("latin-1")
+
+
+class TraceLog:
+    """组的请求计时配置与最近的慢请求（环形缓冲区），只在代理所在的事件循环中使用"""
+
+    def __init__(self, port: int, path: str, config: TraceConfig):
+        self.port = port
+        self.path = path
+        self.config = config
+        self.traces: Deque[dict] = deque(maxlen=config.keep)
+
+    def start(self, method: str, path: str, start: float) -> RequestTrace:
+        """路由匹配完成后调用，start 为开始匹配的时间"""
+        trace = RequestTrace(self, method, path, start)
+        trace.phases["match"] = time.perf_counter() - start
+        return trace
+
+    def record(self, trace: RequestTrace, total: float, error: Optional[BaseException]):
+        if total < self.config.slow_threshold:
+            return
+        self.traces.append({
+            "timestamp": round(time.time(), 3),
+            "port": self.port,
+            "group": self.path,
+            "method": trace.method,
+            "path": trace.path,
+            "backend": trace.backend,
+            "status": trace.status,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "total_ms": round(total * 1000, 2),
+            "phases_ms": {name: round(seconds * 1000, 2) for name, seconds in trace.phases.items()},
+            "notes": dict(trace.notes),
+        })
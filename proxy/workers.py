@@ -0,0 +1,180 @@
+import os
+import time
+import signal
+import socket
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.base import LOGGER
+from utils.config import ConfigManager, ConfigWatcher
+
+
+def bind_socket(port: int, host: str = "0.0.0.0") -> socket.socket:
+    """绑定监听套接字，供 fork 出的工作进程共享"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    except OSError:
+        sock.close()
+        raise
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """多进程工作模式的主进程
+
+    主进程按配置预先绑定所有端口，再 fork 出多个工作进程共享这些套接字，由内核在进程间分配连接。
+    主进程本身不处理请求，只负责：
+
+    + 工作进程意外退出时重新拉起
+    + SIGHUP 或（指定了 watch 时）配置文件变化：端口不变时转发给所有工作进程各自重新加载配置；
+      端口有增减时重新绑定，启动新一批工作进程后再让旧进程退出
+    + SIGTERM / SIGINT：通知所有工作进程退出并等待结束
+    """
+
+    def __init__(
+            self,
+            workers: int,
+            target: Callable[[Dict[int, socket.socket], int], None],
+            watch: Optional[float] = None
+    ):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("多进程模式仅支持 Linux / macOS")
+        self.workers = workers
+        self.target = target  # 工作进程入口，参数为预先绑定的套接字和工作进程编号（0 ~ workers-1）
+        self.sockets: Dict[int, socket.socket] = {}
+        self.children: Dict[int, Dict[int, socket.socket]] = {}  # pid -> 该进程使用的套接字
+        self.slots: Dict[int, int] = {}  # 当前这批工作进程的编号 -> pid，重新拉起的进程沿用原编号
+        self.watch = watch  # 检查配置文件变化的间隔（秒），为空时只响应 SIGHUP
+        self._stopping = False
+        self._reloading = False
+
+    def run(self):
+        self._bind(self._config_ports())
+        self._spawn(self.workers)
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        watcher = ConfigWatcher(ConfigManager.config_file()) if self.watch else None
+        checked = time.monotonic()
+        while not self._stopping:
+            if watcher is not None and time.monotonic() - checked >= self.watch:
+                checked = time.monotonic()
+                if watcher.changed():
+                    LOGGER.info("配置文件已变化，重新加载")
+                    self._reloading = True
+            if self._reloading:
+                self._reloading = False
+                self.reload()
+            self._reap(respawn=True)
+            time.sleep(0.2)
+
+        self._kill(list(self.children), signal.SIGTERM)
+        while self.children:
+            self._reap(respawn=False)
+            time.sleep(0.1)
+        for sock in self.sockets.values():
+            sock.close()
+        LOGGER.info("所有工作进程已退出")
+
+    def reload(self):
+        try:
+            ConfigManager.load_config()
+            ports = self._config_ports()
+        except Exception as e:
+            LOGGER.error(f"重新加载配置失败: {e}")
+            return
+
+        if ports == set(self.sockets):
+            # 端口不变，工作进程在各自的事件循环中重新加载路由
+            self._kill(list(self.children), signal.SIGHUP)
+            LOGGER.info("已通知工作进程重新加载配置")
+            return
+
+        # 端口有变化，已 fork 的进程拿不到新套接字，需要轮换工作进程；
+        # 先绑定新端口，有端口绑定失败时保留当前的套接字和工作进程不变
+        try:
+            self._bind(ports - set(self.sockets))
+        except OSError as e:
+            LOGGER.error(f"绑定新端口失败，保留当前端口 {sorted(self.sockets)}: {e}")
+            return
+        old = list(self.children)
+        for port in set(self.sockets) - ports:
+            self.sockets.pop(port).close()
+        self.slots.clear()
+        self._spawn(self.workers)
+        self._kill(old, signal.SIGTERM)
+        LOGGER.info(f"端口变化，已轮换工作进程，当前端口: {sorted(self.sockets)}")
+
+    def _config_ports(self) -> set:
+        return {proxy.port for proxy in ConfigManager.get_config()}
+
+    def _bind(self, ports: Iterable[int]):
+        """绑定全部端口，任一端口失败时关闭本次已绑定的套接字并抛出 OSError"""
+        bound = {}
+        try:
+            for port in ports:
+                bound[port] = bind_socket(port)
+        except OSError:
+            for sock in bound.values():
+                sock.close()
+            raise
+        self.sockets.update(bound)
+
+    def _spawn(self, count: int):
+        for _ in range(count):
+            sockets = dict(self.sockets)
+            slot = min(set(range(self.workers)) - set(self.slots))
+            pid = os.fork()
+            if pid == 0:
+                self._run_child(sockets, slot)
+            self.children[pid] = sockets
+            self.slots[slot] = pid
+        LOGGER.info(f"工作进程: {sorted(self.children)}")
+
+    def _run_child(self, sockets: Dict[int, socket.socket], slot: int):
+        # 恢复默认信号处理，由工作进程自己的事件循环接管
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        code = 0
+        try:
+            self.target(sockets, slot)
+        except BaseException as e:
+            LOGGER.error(f"工作进程 {os.getpid()} 异常退出: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _kill(self, pids: List[int], sig: int):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self, respawn: bool):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            sockets = self.children.pop(pid, None)
+            for slot, _pid in list(self.slots.items()):
+                if _pid == pid:
+                    del self.slots[slot]
+            # 只有使用当前套接字的进程意外退出才需要补充，轮换下来的旧进程直接回收
+            if respawn and sockets is not None and sockets == self.sockets:
+                LOGGER.warning(f"工作进程 {pid} 退出（状态 {status}），重新启动")
+                self._spawn(1)
+
+    def _on_stop(self, *_):
+        self._stopping = True
+
+    def _on_reload(self, *_):
+        self._reloading = True
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 项目不是安装包，测试直接从仓库根目录导入 models / proxy / utils
+sys.path.insert(0, str(Path(__file__).parents[1]))
@@ -0,0 +1,102 @@
+import time
+
+import httpx
+
+from models.base import CacheConfig
+from proxy.cache import CacheEntry, ResponseCache, is_shareable
+
+
+def make_cache(**config) -> ResponseCache:
+    return ResponseCache(CacheConfig(**config))
+
+
+def put_entry(cache: ResponseCache, headers, ttl: float = 60.0):
+    key, _, _ = cache.lookup("GET", "/a", b"", headers)
+    cache.put(key, CacheEntry(200, [(b"etag", b'"v1"')], b"body", (), ttl))
+    return key
+
+
+def test_requests_with_body_are_not_cached():
+    cache = make_cache()
+    assert cache.lookup("GET", "/a", b"", [("content-length", "3")])[0] is None
+    assert cache.lookup("GET", "/a", b"", [("transfer-encoding", "chunked")])[0] is None
+    assert cache.lookup("GET", "/a", b"", [("content-length", "0")])[0] is not None
+
+
+def test_uncacheable_requests():
+    cache = make_cache()
+    assert cache.lookup("POST", "/a", b"", [])[0] is None
+    assert cache.lookup("GET", "/a", b"", [("cache-control", "no-store")])[0] is None
+
+
+def test_credentialed_requests_use_separate_entries():
+    cache = make_cache()
+    put_entry(cache, [])
+    for name in ("authorization", "cookie"):
+        _, entry, fresh = cache.lookup("GET", "/a", b"", [(name, "x")])
+        assert entry is None and not fresh
+    assert cache.lookup("GET", "/a", b"", [])[2]
+
+
+def test_accept_encoding_is_part_of_key():
+    cache = make_cache()
+    put_entry(cache, [("accept-encoding", "gzip")])
+    assert cache.lookup("GET", "/a", b"", [("accept-encoding", "gzip")])[2]
+    assert cache.lookup("GET", "/a", b"", [])[1] is None
+
+
+def test_client_no_cache_does_not_expire_shared_entry():
+    cache = make_cache()
+    put_entry(cache, [])
+    _, entry, fresh = cache.lookup("GET", "/a", b"", [("cache-control", "no-cache")])
+    assert entry is not None and not fresh
+    assert cache.lookup("GET", "/a", b"", [("cache-control", "max-age=0")])[2] is False
+    assert cache.lookup("GET", "/a", b"", [])[2]
+    assert entry.is_fresh()
+
+
+def test_freshness_shareability():
+    cache = make_cache(default_ttl=5)
+    assert cache.freshness(200, httpx.Headers({"cache-control": "max-age=10"})) == 10
+    assert cache.freshness(200, httpx.Headers({"cache-control": "max-age=10", "set-cookie": "s=1"})) is None
+    assert cache.freshness(200, httpx.Headers({"cache-control": "private, max-age=10"})) is None
+    assert cache.freshness(200, httpx.Headers({"cache-control": "no-store"})) is None
+    assert cache.freshness(200, httpx.Headers({"vary": "*"})) is None
+    assert cache.freshness(500, httpx.Headers({"cache-control": "max-age=10"})) is None
+
+
+def test_default_ttl_only_for_anonymous_requests():
+    cache = make_cache(default_ttl=5)
+    assert cache.freshness(200, httpx.Headers()) == 5
+    assert cache.freshness(200, httpx.Headers(), credentialed=True) is None
+    assert cache.freshness(200, httpx.Headers({"cache-control": "max-age=10"}), credentialed=True) is None
+    assert cache.freshness(200, httpx.Headers({"cache-control": "public, max-age=10"}), credentialed=True) == 10
+    assert cache.freshness(200, httpx.Headers({"cache-control": "s-maxage=20"}), credentialed=True) == 20
+
+
+def test_is_shareable_for_credentialed_requests():
+    assert is_shareable(httpx.Headers())
+    assert not is_shareable(httpx.Headers(), credentialed=True)
+    assert is_shareable(httpx.Headers({"cache-control": "public"}), credentialed=True)
+
+
+def test_lru_eviction_by_size():
+    cache = make_cache(max_bytes=3 * (4 + 256 + len(b"etag") + len(b'"v1"')))
+    for path in ("/1", "/2", "/3"):
+        key, _, _ = cache.lookup("GET", path, b"", [])
+        cache.put(key, CacheEntry(200, [(b"etag", b'"v1"')], b"body", (), 60))
+    # 访问 /1 后它变为最近使用，再放入新条目时淘汰 /2
+    assert cache.lookup("GET", "/1", b"", [])[2]
+    key, _, _ = cache.lookup("GET", "/4", b"", [])
+    cache.put(key, CacheEntry(200, [(b"etag", b'"v1"')], b"body", (), 60))
+    assert cache.lookup("GET", "/2", b"", [])[1] is None
+    assert cache.lookup("GET", "/1", b"", [])[1] is not None
+    assert cache.size <= cache.config.max_bytes
+
+
+def test_expired_entry_needs_revalidation():
+    cache = make_cache()
+    put_entry(cache, [], ttl=0.0)
+    time.sleep(0.001)
+    _, entry, fresh = cache.lookup("GET", "/a", b"", [])
+    assert entry is not None and entry.revalidatable and not fresh
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from models.base import CoalesceConfig
+from proxy.cache import CachedResponse
+from proxy.coalesce import Coalescer
+from proxy.timeouts import DeadlineExceeded
+
+
+def upstream_response(headers=None, request_headers=None) -> httpx.Response:
+    request = httpx.Request("GET", "http://backend/a", headers=request_headers)
+    return httpx.Response(200, headers=headers, content=b"body", request=request)
+
+
+def test_key_rules():
+    coalescer = Coalescer(CoalesceConfig())
+    assert coalescer.key("GET", "/a", b"", []) is not None
+    assert coalescer.key("POST", "/a", b"", []) is None
+    # 带请求体的 GET（如搜索接口）不合并
+    assert coalescer.key("GET", "/a", b"", [("content-length", "5")]) is None
+    assert coalescer.key("GET", "/a", b"", [("transfer-encoding", "chunked")]) is None
+    # 凭据不同的请求不合并
+    assert coalescer.key("GET", "/a", b"", [("authorization", "a")]) != coalescer.key("GET", "/a", b"", [("authorization", "b")])
+    assert coalescer.key("GET", "/a", b"", [("cookie", "a")]) != coalescer.key("GET", "/a", b"", [])
+
+
+def test_waiter_gets_shared_response():
+    async def main():
+        coalescer = Coalescer(CoalesceConfig())
+        key = coalescer.key("GET", "/a", b"", [])
+        flight = coalescer.lead(key)
+        joined = coalescer.join(key)
+        waiter = asyncio.ensure_future(coalescer.wait(joined))
+        await asyncio.sleep(0)
+        cached = CachedResponse(200, [], b"body")
+        coalescer.share(key, flight, cached)
+        assert await waiter is cached
+        assert coalescer.coalesced == 1 and not coalescer.flights
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("headers, request_headers", [
+    ({"set-cookie": "session=1"}, None),
+    ({"cache-control": "private"}, None),
+    ({"cache-control": "no-store"}, None),
+    (None, {"authorization": "token"}),
+])
+def test_unshareable_response_is_not_fanned_out(headers, request_headers):
+    async def main():
+        coalescer = Coalescer(CoalesceConfig())
+        key = coalescer.key("GET", "/a", b"", [])
+        flight = coalescer.lead(key)
+        waiter = asyncio.ensure_future(coalescer.wait(coalescer.join(key)))
+        await asyncio.sleep(0)
+        coalescer.share(key, flight, upstream_response(headers, request_headers))
+        assert await waiter is None
+        assert not coalescer.flights
+
+    asyncio.run(main())
+
+
+def test_wait_is_bounded_by_deadline():
+    async def main():
+        coalescer = Coalescer(CoalesceConfig())
+        key = coalescer.key("GET", "/a", b"", [])
+        flight = coalescer.lead(key)
+        joined = coalescer.join(key)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await coalescer.wait(joined, start + 0.05)
+        assert time.monotonic() - start < 0.5
+        # 第一个请求不受等待者超时的影响
+        assert joined.waiters == 0 and not flight.future.done()
+        coalescer.share(key, flight, CachedResponse(200, [], b"body"))
+
+    asyncio.run(main())
+
+
+def test_max_waiters():
+    async def main():
+        coalescer = Coalescer(CoalesceConfig(max_waiters=1))
+        key = coalescer.key("GET", "/a", b"", [])
+        coalescer.lead(key)
+        assert coalescer.join(key) is not None
+        assert coalescer.join(key) is None
+
+    asyncio.run(main())
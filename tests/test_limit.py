@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from models.base import Backend, Group, LimitConfig, Proxy, RetryConfig
+from proxy.base import ProxyServer
+from proxy.limit import Limiter, Overloaded
+from proxy.retry import LATENCY_MIN_SAMPLES
+from proxy.timeouts import DeadlineExceeded
+
+PORT = 18080
+
+
+def make_limiter(backends: int = 2, **config) -> Limiter:
+    return Limiter(Group(
+        path="/",
+        backends=[Backend(url=f"http://backend{i}") for i in range(backends)],
+        limit=LimitConfig(**config),
+    ))
+
+
+def test_token_bucket():
+    async def main():
+        limiter = make_limiter(rate=1, burst=2)
+        await limiter.acquire(0)
+        await limiter.acquire(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire(0)
+        assert error.value.status_code == 429 and error.value.retry_after >= 1
+        assert limiter.rejected == 1
+
+    asyncio.run(main())
+
+
+def test_per_backend_limit():
+    async def main():
+        limiter = make_limiter(max_in_flight_per_backend=1)
+        await limiter.acquire(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire(0)
+        assert error.value.status_code == 503
+        with pytest.raises(Overloaded):
+            limiter.acquire_backend(0)
+        await limiter.acquire(1)
+        limiter.release(0)
+        limiter.acquire_backend(0)
+        assert limiter.backend_in_flight == [1, 1]
+
+    asyncio.run(main())
+
+
+def test_full_queue_rejects():
+    async def main():
+        limiter = make_limiter(max_in_flight=1, queue_size=0)
+        await limiter.acquire(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire(1)
+        assert error.value.status_code == 503
+        # 被拒绝的请求不占用后端名额
+        assert limiter.backend_in_flight == [1, 0]
+
+    asyncio.run(main())
+
+
+def test_release_hands_slot_to_queued_request():
+    async def main():
+        limiter = make_limiter(max_in_flight=1, queue_size=1)
+        await limiter.acquire(0)
+        queued = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        assert len(limiter.queue) == 1
+        limiter.release(0)
+        await queued
+        assert limiter.in_flight == 1 and limiter.backend_in_flight == [0, 1]
+        limiter.release(1)
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_queue_timeout():
+    async def main():
+        limiter = make_limiter(max_in_flight=1, queue_size=1, queue_timeout=0.05)
+        await limiter.acquire(0)
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire(0)
+        assert error.value.status_code == 503
+        assert not limiter.queue and limiter.in_flight == 1 and limiter.backend_in_flight == [1, 0]
+
+    asyncio.run(main())
+
+
+def test_queue_wait_is_bounded_by_deadline():
+    async def main():
+        limiter = make_limiter(max_in_flight=1, queue_size=1, queue_timeout=5)
+        await limiter.acquire(0)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await limiter.acquire(0, start + 0.05)
+        assert time.monotonic() - start < 1
+        assert not limiter.queue and limiter.in_flight == 1
+
+    asyncio.run(main())
+
+
+async def slow_backend0(request: httpx.Request) -> httpx.Response:
+    if request.url.host == "backend0":
+        await asyncio.sleep(0.2)
+
+    async def body():
+        yield request.url.host.encode()
+
+    return httpx.Response(200, content=body())
+
+
+@pytest.mark.parametrize("max_in_flight, winner, rejected", [(1, b"backend0", 1), (2, b"backend1", 0)])
+def test_hedge_needs_its_own_permit(max_in_flight, winner, rejected):
+    async def main():
+        server = ProxyServer([Proxy(port=PORT, groups=[Group(
+            path="/",
+            current_backend=0,
+            backends=[Backend(url="http://backend0"), Backend(url="http://backend1")],
+            retry=RetryConfig(hedge_percentile=50, hedge_min_delay=0.01),
+            limit=LimitConfig(max_in_flight=max_in_flight),
+        )])])
+        route = server.routes[PORT].match("/")
+        route.client = httpx.AsyncClient(transport=httpx.MockTransport(slow_backend0))
+        for _ in range(LATENCY_MIN_SAMPLES):
+            route.retry.observe(0.01)
+
+        _, row, url = server.match_target(PORT, "/a", [])
+        response = await server.fetch(route, row, "GET", "/a", url, b"", [], None)
+        assert await response.aread() == winner
+        await response.aclose()
+        # 组的并发已满时对冲请求被拒绝，原请求继续；许可在响应关闭后全部归还
+        limiter = route.limiter
+        assert route.retry.hedged == 1 and limiter.rejected == rejected
+        assert limiter.in_flight == 0 and limiter.backend_in_flight == [0, 0]
+
+    asyncio.run(main())
+
+
+def test_inbound_timeout_header_bounds_the_queue():
+    async def main():
+        server = ProxyServer([Proxy(port=PORT, groups=[Group(
+            path="/",
+            current_backend=0,
+            backends=[Backend(url="http://backend0")],
+            limit=LimitConfig(max_in_flight=1, queue_size=1, queue_timeout=5),
+        )])])
+        route = server.routes[PORT].match("/")
+        await route.limiter.acquire(0)
+        headers = [("x-request-timeout-ms", "50")]
+        _, row, url = server.match_target(PORT, "/a", headers)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await server.fetch(route, row, "GET", "/a", url, b"", headers, None)
+        assert time.monotonic() - start < 1
+
+    asyncio.run(main())
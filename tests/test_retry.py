@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import pytest
+
+from models.base import Backend, Group, LimitConfig, Proxy, RetryConfig
+from proxy.base import ProxyServer
+from proxy.retry import LATENCY_MIN_SAMPLES, RetryPolicy
+
+PORT = 18080
+
+
+def test_budget_limits_retries():
+    policy = RetryPolicy(RetryConfig(budget_ratio=0.5, budget_burst=2))
+    assert policy.withdraw() and policy.withdraw()
+    assert not policy.withdraw()
+    # 两个正常请求存入一个令牌
+    policy.deposit()
+    assert not policy.withdraw()
+    policy.deposit()
+    assert policy.withdraw()
+    for _ in range(10):
+        policy.deposit()
+    assert policy.tokens == 2
+
+
+def test_hedge_delay_from_percentile():
+    policy = RetryPolicy(RetryConfig(hedge_percentile=90, hedge_min_delay=0.01))
+    for i in range(LATENCY_MIN_SAMPLES - 1):
+        policy.observe(0.1)
+    assert policy.hedge_delay() is None
+    policy.observe(0.1)
+    assert policy.hedge_delay() == pytest.approx(0.1)
+    assert RetryPolicy(RetryConfig()).hedge_delay() is None
+
+
+def make_server(handler, **group) -> ProxyServer:
+    server = ProxyServer([Proxy(port=PORT, groups=[Group(
+        path="/",
+        current_backend=0,
+        backends=[Backend(url="http://backend0"), Backend(url="http://backend1")],
+        **group,
+    )])])
+    route = server.routes[PORT].match("/")
+    route.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return server
+
+
+async def body(data: bytes):
+    yield data
+
+
+def refuse_backend0(request: httpx.Request) -> httpx.Response:
+    if request.url.host == "backend0":
+        raise httpx.ConnectError("refused", request=request)
+    # 流式响应体与真实的上游连接一样，在调用方关闭响应时才归还许可
+    return httpx.Response(200, content=body(request.url.host.encode()))
+
+
+async def forward(server: ProxyServer, headers=()):
+    route, row, url = server.match_target(PORT, "/a", list(headers))
+    return await server.fetch(route, row, "GET", "/a", url, b"", list(headers), None)
+
+
+def test_retry_moves_to_next_backend():
+    async def main():
+        server = make_server(refuse_backend0, retry=RetryConfig(attempts=1))
+        response = await forward(server)
+        assert response.status_code == 200 and (await response.aread()) == b"backend1"
+        await response.aclose()
+        assert server.retries[(PORT, "/")].retried == 1
+
+    asyncio.run(main())
+
+
+def test_retry_stops_when_budget_is_spent():
+    async def main():
+        server = make_server(refuse_backend0, retry=RetryConfig(attempts=1, budget_ratio=0, budget_burst=1))
+        response = await forward(server)
+        await response.aclose()
+        with pytest.raises(httpx.ConnectError):
+            await forward(server)
+        assert server.retries[(PORT, "/")].retried == 1
+
+    asyncio.run(main())
+
+
+def test_retry_takes_the_new_backend_slot():
+    async def main():
+        server = make_server(
+            refuse_backend0,
+            retry=RetryConfig(attempts=1),
+            limit=LimitConfig(max_in_flight=1, max_in_flight_per_backend=1),
+        )
+        limiter = server.limiters[(PORT, "/")]
+        response = await forward(server)
+        # 组的名额由原请求持有，重试换到的后端另外占用一个后端名额
+        assert limiter.in_flight == 1 and limiter.backend_in_flight == [1, 1]
+        await response.aclose()
+        assert limiter.in_flight == 0 and limiter.backend_in_flight == [0, 0]
+
+    asyncio.run(main())
@@ -0,0 +1,13 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from proxy.runner import ProxyThread
+
+
+class ProxyEvents(QObject):
+    """把代理线程推送的事件转为 Qt 信号，跨线程的信号会排队到界面线程中处理"""
+
+    event = pyqtSignal(str, dict)
+
+    def __init__(self, proxy_thread: ProxyThread):
+        super().__init__()
+        proxy_thread.proxy_server.add_listener(self.event.emit)
@@ -1,6 +1,6 @@
 import sys
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 from PyQt6.QtWidgets import (
     QMainWindow,
     QTabWidget,
@@ -15,8 +15,9 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QIntValidator
 from PyQt6.QtCore import Qt
 
-from proxy.base import ProxyServer
+from proxy.runner import ProxyThread
 from models.base import Group, Proxy
+from ui.bridge import ProxyEvents
 from ui.custom_tab import CustomTabBar
 from ui.tab_content import GroupTab
 from utils.base import get_app_info, ROOT
@@ -76,10 +77,13 @@ class AddGroupDialog(QDialog):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, proxy_server: ProxyServer):
+    def __init__(self, proxy_thread: ProxyThread):
         super().__init__()
         self.setObjectName("MainWindow")
-        self.proxy_server = proxy_server
+        # 代理运行在独立线程中，界面只通过 proxy_thread 投递命令、通过 proxy_events 接收事件
+        self.proxy_thread = proxy_thread
+        self.proxy_events = ProxyEvents(proxy_thread)
+        self.proxy_events.event.connect(self.on_proxy_event)
         
         self.setWindowTitle(get_app_info())
         self.resize(800, 600)
@@ -119,6 +123,15 @@ class MainWindow(QMainWindow):
         # 加载已有配置
         self.load_groups()
     
+    def on_proxy_event(self, event: str, data: dict):
+        """在状态栏显示端口排空的进度"""
+        if event != "drain":
+            return
+        if data["done"]:
+            self.statusBar().showMessage(f"端口 {data['port']} 已停止", 5000)
+        else:
+            self.statusBar().showMessage(f"端口 {data['port']} 正在停止，等待 {data['connections']} 个连接结束")
+
     def create_menu_bar(self):
         menubar = self.menuBar()
         settings_menu = menubar.addMenu("设置")
@@ -131,8 +144,6 @@ class MainWindow(QMainWindow):
             values = dialog.get_values()
             port = int(values['port'])
 
-            groups = self.proxy_server.servers.get(port, [])
-
             # 创建新组
             group = Group(
                 path=values['path'],
@@ -140,20 +151,17 @@ class MainWindow(QMainWindow):
                 backends=[]
             )
 
-            groups.append(group)
-            
             # 添加新标签页
             self.add_group_tab(port, group)
             
-            # 更新代理服务器
-            self.proxy_server.servers[port] = groups
-            self.proxy_server.restart_server()
+            # 更新代理服务器（传递副本，界面与代理线程不共享可变对象）
+            self.proxy_thread.call(self.proxy_thread.proxy_server.add_group, port, group.model_copy(deep=True))
 
             # 保存配置
             self.save_config()
     
     def add_group_tab(self, port: int, group: Group):
-        tab = GroupTab(self, self.proxy_server, port, group)
+        tab = GroupTab(self, self.proxy_thread, port, group)
         tab_name = f"[{group.alias}] - {port}{group.path}" if group.alias else f"{port}{group.path}"
         self.tab_widget.addTab(tab, tab_name)
 
@@ -167,21 +175,14 @@ class MainWindow(QMainWindow):
             tab: GroupTab = self.tab_widget.widget(index)
             select_group: Group = tab.group
             
-            # 从代理服务器中移除
-            groups: List[Group] = self.proxy_server.servers[tab.port]
-            for group in groups:
-                if group.path == select_group.path:
-                    groups.remove(group)
-                    break
-
-            if not groups or len(groups) <= 0:
-                del self.proxy_server.servers[tab.port]
-            
-            # 移除标签页
+            # 移除标签页，并断开事件，避免之后添加相同端口和路径的组时旧标签页覆盖新组的配置
             self.tab_widget.removeTab(index)
+            if tab.main_window is not None:
+                tab.main_window.proxy_events.event.disconnect(tab.on_proxy_event)
+            tab.deleteLater()
 
-            # 重启代理服务器
-            self.proxy_server.restart_server()
+            # 从代理服务器中移除，端口下没有组时会停止该端口
+            self.proxy_thread.call(self.proxy_thread.proxy_server.remove_group, tab.port, select_group.path)
 
             # 保存配置
             self.save_config()
@@ -193,8 +194,13 @@ class MainWindow(QMainWindow):
                 self.add_group_tab(proxy.port, group)
     
     def save_config(self):
+        servers: Dict[int, List[Group]] = {}
+        for index in range(self.tab_widget.count()):
+            tab: GroupTab = self.tab_widget.widget(index)
+            servers.setdefault(tab.port, []).append(tab.group)
+
         proxys = [
-            Proxy(port=port, groups=groups) for port, groups in self.proxy_server.servers.items()
+            Proxy(port=port, groups=groups) for port, groups in servers.items()
         ]
         ConfigManager.save_config(proxys)
 
@@ -16,7 +16,7 @@ from PyQt6.QtGui import QColor, QBrush, QIcon, QMovie
 from PyQt6.QtCore import Qt, QMetaObject, QTimer, QSize
 from qasync import asyncSlot
 from models.base import Backend, Group
-from proxy.base import ProxyServer
+from proxy.runner import ProxyThread
 from utils.base import get_app_info, ROOT, join_url
 from utils.config import ConfigManager
 
@@ -37,11 +37,11 @@ class RowColorDelegate(QStyledItemDelegate):
 
 
 class GroupTab(QWidget):
-    def __init__(self, parent: QMainWindow, proxy_server: ProxyServer, port: int, group: Group):
+    def __init__(self, parent: QMainWindow, proxy_thread: ProxyThread, port: int, group: Group):
         super().__init__(parent)
         self.port = port
         self.group = group
-        self.proxy_server = proxy_server
+        self.proxy_thread = proxy_thread
 
         # 标记
         self.is_loading = True
@@ -133,6 +133,10 @@ class GroupTab(QWidget):
         # 添加一个方法来获取主窗口
         self.main_window = self._get_main_window()
 
+        # 接收代理线程推送的事件
+        if self.main_window:
+            self.main_window.proxy_events.event.connect(self.on_proxy_event)
+
     def _load_backends(self):
         for backend in self.group.backends:
             row_count = self.table.rowCount()
@@ -298,31 +302,60 @@ class GroupTab(QWidget):
         self.set_row_testing_status(row, True)
 
         try:
-            is_healthy = await self.proxy_server.check_backend_health(url)
-            status = "正常" if is_healthy else "异常"
+            # 在代理线程中检查，界面事件循环只等待结果
+            is_healthy = await asyncio.wrap_future(self.proxy_thread.submit(
+                self.proxy_thread.proxy_server.test_backend(self.port, self.group.path, url)
+            ))
 
             # 移除测试中状态
             self.set_row_testing_status(row, False)
 
             # 更新状态
-            item = self.table.item(row, 2)
-            item.setText(status)
-            if status == "正常":
-                item.setForeground(QColor("green"))
-            else:
-                item.setForeground(QColor("red"))
+            self.set_row_health(row, is_healthy)
 
             return is_healthy
         except Exception as e:
             # 发生异常时也要移除测试中状态
             self.set_row_testing_status(row, False)
 
-            item = self.table.item(row, 2)
-            item.setText("异常")
-            item.setForeground(QColor("red"))
+            self.set_row_health(row, False)
 
             return False
 
+    def set_row_health(self, row, is_healthy):
+        item = self.table.item(row, 2)
+        if item is None:
+            return
+        item.setText("正常" if is_healthy else "异常")
+        item.setForeground(QColor("green") if is_healthy else QColor("red"))
+
+    def on_proxy_event(self, event: str, data: dict):
+        """处理代理线程推送的事件（已排队到界面线程）"""
+        if data.get("port") != self.port or data.get("path") != self.group.path:
+            return
+
+        if event == "backend":
+            # 代理自动切换了当前后端
+            self.group.current_backend = data["current_backend"]
+            self._set_row_color()
+            self.table.viewport().update()
+            # 保存自动切换的结果，重启后沿用
+            ConfigManager.save_group(self.port, self.group)
+        elif event in ("health", "outlier"):
+            for row in range(self.table.rowCount()):
+                url_item = self.table.item(row, 1)
+                if url_item and url_item.text().strip() == data["url"] and row not in self.testing_rows:
+                    if event == "health":
+                        self.set_row_health(row, data["healthy"])
+                    elif data["ejected"]:
+                        # 被动异常检测摘除，到期后自动试探恢复
+                        item = self.table.item(row, 2)
+                        if item is not None:
+                            item.setText("熔断")
+                            item.setForeground(QColor("red"))
+                    else:
+                        self.set_row_health(row, True)
+
     @asyncSlot()
     async def enable_backend(self, row):
         if row < 0 or row >= self.table.rowCount():
@@ -371,6 +404,8 @@ class GroupTab(QWidget):
         self.test_all_btn.setEnabled(True)
 
     def save_backends(self):
+        # 界面不编辑权重，按地址保留原有的权重
+        weights = {backend.url: backend.weight for backend in self.group.backends}
         self.group.backends = []
         for row in range(self.table.rowCount()):
             alias = self.table.item(row, 0).text().strip()
@@ -378,14 +413,13 @@ class GroupTab(QWidget):
             if alias and url:  # 只有当别名和接口路径都不为空时才保存
                 backend = Backend(
                     url=url,
-                    alias=alias
+                    alias=alias,
+                    weight=weights.get(url, 1)
                 )
                 self.group.backends.append(backend)
 
-        for idx, group in enumerate(self.proxy_server.servers[self.port]):
-            if group.path == self.group.path:
-                self.proxy_server.servers[self.port][idx] = self.group
-                break
+        # 更新代理线程中的转发组（传递副本，界面与代理线程不共享可变对象）
+        self.proxy_thread.call(self.proxy_thread.proxy_server.update_group, self.port, self.group.model_copy(deep=True))
         # 保存到配置文件
         ConfigManager.save_group(self.port, self.group)
 
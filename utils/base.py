@@ -1,5 +1,8 @@
 import logging
+import os
+import stat
 import sys
+import tempfile
 
 import yaml
 from pathlib import Path
@@ -13,6 +16,10 @@ if getattr(sys, 'frozen', None):
 else:
     ROOT = Path(__file__).parents[1]
 
+# 进程的 umask 只能通过设置来读取，在导入时（单线程）读一次，保存配置的后台线程中不再修改
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 def load_yaml(file_path: Path):
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -20,9 +27,29 @@ def load_yaml(file_path: Path):
 
 
 def save_yaml(file_path: Path, data):
+    """先写入同目录下的临时文件再原子替换，写入中途崩溃不会损坏原文件
+
+    mkstemp 创建的临时文件权限为 0600，替换前改为原文件的权限（新文件按 umask 的默认权限）。
+    """
     file_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(file_path, 'w', encoding='utf-8') as f:
-        yaml.safe_dump(data, f, allow_unicode=True)
+    try:
+        mode = stat.S_IMODE(file_path.stat().st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    fd, temp_path = tempfile.mkstemp(prefix=f".{file_path.name}.", suffix=".tmp", dir=file_path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(data, f, allow_unicode=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
 
 
 def join_url(base, *paths):
@@ -1,9 +1,17 @@
+import os
 import sys
-from typing import List
+import time
+import atexit
+import threading
+from typing import List, Optional, Tuple
 from pathlib import Path
 
-from models.base import Proxy, Group, Backend
-from utils.base import load_yaml, save_yaml
+from models.base import (
+    Proxy, Group, Backend,
+    PoolConfig, BalanceConfig, HealthConfig, OutlierConfig, TimeoutConfig, CacheConfig, CoalesceConfig, RetryConfig,
+    LimitConfig, TraceConfig
+)
+from utils.base import load_yaml, save_yaml, LOGGER
 
 if getattr(sys, 'frozen', None):
     ROOT = Path(sys.executable).parent
@@ -11,10 +19,118 @@ else:
     ROOT = Path(__file__).parents[1]
 
 
+class ConfigWriter:
+    """在后台线程中写入配置文件，合并短时间内的多次保存
+
+    最后一次保存后 delay 秒内没有新的保存、或第一次未写入的保存已等待 max_delay 秒时写入最新的一份，
+    调用方不会被文件写入阻塞。
+    """
+
+    def __init__(self, delay: float = 0.5, max_delay: float = 2.0):
+        self.delay = delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending: Optional[Tuple[Path, dict]] = None
+        self._first = 0.0  # 第一次未写入的保存时间
+        self._last = 0.0  # 最后一次保存时间
+        self._urgent = False  # 需要立即写入（flush）
+        self._writing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, file_path: Path, data: dict):
+        """data 交给写入线程后调用方不能再修改"""
+        with self._cond:
+            now = time.monotonic()
+            if self._pending is None:
+                self._first = now
+            self._pending = (file_path, data)
+            self._last = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self):
+        """立即写入尚未写入的配置并等待写完"""
+        with self._cond:
+            if self._pending is None and not self._writing:
+                return
+            self._urgent = True
+            self._cond.notify_all()
+            while self._pending is not None or self._writing:
+                self._cond.wait()
+            # 正在写入时调用的 flush 不会经过 _run 清除标记，写完后清除，之后的保存照常合并
+            self._urgent = False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending is None:
+                        self._cond.wait()
+                        continue
+                    remaining = min(self._last + self.delay, self._first + self.max_delay) - time.monotonic()
+                    if self._urgent or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                file_path, data = self._pending
+                self._pending = None
+                self._urgent = False
+                self._writing = True
+            try:
+                save_yaml(file_path, data)
+            except Exception as e:
+                LOGGER.error(f"保存配置文件失败: {e}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+
+class ConfigWatcher:
+    """轮询配置文件的修改时间与大小，不依赖第三方文件监听库
+
+    检测到变化后还要在下一次检查时保持不变才视为写入完成，避免读到写了一半的文件。
+    """
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+        self._applied = self._stamp()  # 已加载的版本
+        self._seen = self._applied  # 上一次检查到的版本
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        """定期调用，配置文件有变化且已稳定时返回 True"""
+        stamp = self._stamp()
+        stable = stamp == self._seen
+        self._seen = stamp
+        if stable and stamp != self._applied and stamp is not None:
+            self._applied = stamp
+            return True
+        return False
+
+
 class ConfigManager:
     _config = None
     _config_file = ROOT / "config/config.yml"
     _is_loaded = False
+    _writer = ConfigWriter()
+
+    @classmethod
+    def set_config_file(cls, file_path: Path):
+        """使用指定的配置文件，需要在加载配置前调用"""
+        cls._config_file = Path(file_path)
+        cls._is_loaded = False
+
+    @classmethod
+    def config_file(cls) -> Path:
+        return cls._config_file
 
     @classmethod
     def load_config(cls):
@@ -38,13 +154,24 @@ class ConfigManager:
                     path=url,
                     alias=_group.get("alias"),
                     current_backend=_group.get("current_backend"),
-                    backends=[]
+                    backends=[],
+                    pool=PoolConfig(**_group["pool"]) if _group.get("pool") else None,
+                    balance=BalanceConfig(**_group["balance"]) if _group.get("balance") else None,
+                    health=HealthConfig(**_group["health"]) if _group.get("health") else None,
+                    outlier=OutlierConfig(**_group["outlier"]) if _group.get("outlier") else None,
+                    timeout=TimeoutConfig(**_group["timeout"]) if _group.get("timeout") else None,
+                    cache=CacheConfig(**_group["cache"]) if _group.get("cache") else None,
+                    coalesce=CoalesceConfig(**_group["coalesce"]) if _group.get("coalesce") else None,
+                    retry=RetryConfig(**_group["retry"]) if _group.get("retry") else None,
+                    limit=LimitConfig(**_group["limit"]) if _group.get("limit") else None,
+                    trace=TraceConfig(**_group["trace"]) if _group.get("trace") else None
                 )
                 proxy.groups.append(group)
                 for _backend in _group.get("backends", []):
                     backend = Backend(
                         url=_backend.get("url"),
-                        alias=_backend.get("alias")
+                        alias=_backend.get("alias"),
+                        weight=_backend.get("weight", 1)
                     )
                     group.backends.append(backend)
             proxys.append(proxy)
@@ -58,7 +185,14 @@ class ConfigManager:
         if proxys is not None:
             cls._config = cls._convert_config(proxys)
 
-        save_yaml(cls._config_file, cls._config)
+        # 各组的配置只整体替换、不原地修改，复制两层即可得到写入线程可以安全读取的快照
+        snapshot = {port: dict(groups) for port, groups in cls._config.items()}
+        cls._writer.schedule(cls._config_file, snapshot)
+
+    @classmethod
+    def flush(cls):
+        """等待尚未写入的配置写入文件，退出前调用"""
+        cls._writer.flush()
 
     @classmethod
     def save_group(cls, port: int, group: Group):
@@ -68,17 +202,7 @@ class ConfigManager:
         if port not in cls._config:
             cls._config[port] = {}
 
-        cls._config[port][group.path] = {
-            "alias": group.alias,
-            "current_backend": group.current_backend,
-            "backends": [
-                {
-                    "url": backend.url,
-                    "alias": backend.alias
-                }
-                for backend in group.backends
-            ]
-        }
+        cls._config[port][group.path] = cls._dump_group(group)
 
         cls.save_config()
 
@@ -90,16 +214,10 @@ class ConfigManager:
         if port not in cls._config:
             cls._config[port] = {}
 
-        if path not in cls._config[port]:
-            cls._config[port][path] = {}
-
-        cls._config[port][path]["backends"] = [
-            {
-                "url": backend.url,
-                "alias": backend.alias
-            }
-            for backend in backends
-        ]
+        cls._config[port][path] = {
+            **cls._config[port].get(path, {}),
+            "backends": [cls._dump_backend(backend) for backend in backends]
+        }
 
         cls.save_config()
 
@@ -109,17 +227,51 @@ class ConfigManager:
         for proxy in proxys:
             groups = {}
             for group in proxy.groups:
-                groups[group.path] = {
-                    "alias": group.alias,
-                    "current_backend": group.current_backend,
-                    "backends": [
-                        {
-                            "url": backend.url,
-                            "alias": backend.alias
-                        }
-                        for backend in group.backends
-                    ]
-                }
+                groups[group.path] = cls._dump_group(group)
             config[proxy.port] = groups
 
         return config
+
+    @classmethod
+    def _dump_backend(cls, backend: Backend) -> dict:
+        data = {
+            "url": backend.url,
+            "alias": backend.alias
+        }
+        if backend.weight != 1:
+            data["weight"] = backend.weight
+        return data
+
+    @classmethod
+    def _dump_group(cls, group: Group) -> dict:
+        data = {
+            "alias": group.alias,
+            "current_backend": group.current_backend,
+            "backends": [cls._dump_backend(backend) for backend in group.backends]
+        }
+        # 可选配置项只在设置过时写入，保持配置文件简洁
+        if group.pool is not None:
+            data["pool"] = group.pool.model_dump()
+        if group.balance is not None:
+            data["balance"] = group.balance.model_dump(exclude_none=True)
+        if group.health is not None:
+            data["health"] = group.health.model_dump(exclude_none=True)
+        if group.outlier is not None:
+            data["outlier"] = group.outlier.model_dump()
+        if group.timeout is not None:
+            data["timeout"] = group.timeout.model_dump()
+        if group.cache is not None:
+            data["cache"] = group.cache.model_dump()
+        if group.coalesce is not None:
+            data["coalesce"] = group.coalesce.model_dump()
+        if group.retry is not None:
+            data["retry"] = group.retry.model_dump()
+        if group.limit is not None:
+            data["limit"] = group.limit.model_dump(exclude_none=True)
+        if group.trace is not None:
+            data["trace"] = group.trace.model_dump()
+        return data
+
+
+# 正常退出时写入尚未写入的配置
+atexit.register(ConfigManager.flush)